@@ -2,6 +2,9 @@ __version__ = "0.6.2"
 
 import sys
 import os
+import time
+
+STARTUP_START = time.perf_counter()
 
 ap_path = os.path.abspath(os.path.dirname(sys.argv[0]))
 sys.path.insert(0, ap_path)
@@ -11,7 +14,82 @@ sys.path.insert(0, ap_path)
 if __name__ == "__mp_main__":
     sys.stderr = None
 
-from worlds import AutoWorldRegister
+
+def selected_apworlds():
+    """
+    The apworlds given with -g, None when every world has to be loaded. This
+    runs before the arguments are parsed for real since it decides what
+    `import worlds` loads. Child processes get the selection through
+    APFUZZ_WORLDS.
+    """
+    if "APFUZZ_WORLDS" in os.environ:
+        return set(os.environ["APFUZZ_WORLDS"].split(",")) if os.environ["APFUZZ_WORLDS"] else None
+
+    from argparse import ArgumentParser
+    parser = ArgumentParser(add_help=False)
+    parser.add_argument("-g", "--game", default=[], action="append")
+    # These run worlds that aren't known from the command line
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--minimize")
+    parser.add_argument("--agent")
+    # Static YAMLs are usually for other games
+    parser.add_argument("--with-static-worlds")
+    try:
+        known, _ = parser.parse_known_args()
+    except SystemExit:
+        # The real parser will complain
+        return None
+    if not known.game or known.resume or known.minimize or known.agent or known.with_static_worlds:
+        return None
+    return set(known.game)
+
+
+class _ScandirList(list):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def close(self):
+        pass
+
+
+def _import_selected_worlds(apworlds):
+    """
+    Imports `worlds` while hiding the folders and .apworld files of the worlds
+    that weren't selected from the scan that loads them. They can still be
+    imported explicitly, by another world or a hook.
+    """
+    scandir = os.scandir
+
+    def selected_scandir(path="."):
+        entries = scandir(path)
+        if os.path.basename(os.path.normpath(os.fspath(path))) not in ("worlds", "custom_worlds"):
+            return entries
+        with entries:
+            return _ScandirList(
+                entry for entry in entries
+                if entry.name.startswith(("_", "."))
+                or entry.name.removesuffix(".apworld") in apworlds
+            )
+
+    os.scandir = selected_scandir
+    try:
+        import worlds
+    finally:
+        os.scandir = scandir
+
+
+SELECTED_APWORLDS = selected_apworlds()
+if SELECTED_APWORLDS is not None:
+    # The generic world is what every multiworld is built on
+    _import_selected_worlds(SELECTED_APWORLDS | {"generic"})
+    os.environ["APFUZZ_WORLDS"] = ",".join(sorted(SELECTED_APWORLDS))
+else:
+    os.environ["APFUZZ_WORLDS"] = ""
+
+from worlds import AutoWorld, AutoWorldRegister
 from Options import (
     get_option_groups,
     Choice,
@@ -35,47 +113,75 @@ from Utils import __version__ as __ap_version__
 import Utils
 import settings
 
+import Generate
 from Generate import main as GenMain
 try:
     from Generate import PlayerFilesError
 except ImportError:
     class PlayerFilesError(Exception):
         pass
-from Fill import FillError
+import Main
 from Main import main as ERmain
 from settings import get_settings
 from argparse import Namespace, ArgumentParser
 from concurrent.futures import TimeoutError
-from collections import defaultdict
+from collections import Counter, defaultdict, deque
 import threading
-from contextlib import redirect_stderr, redirect_stdout
+from contextlib import contextmanager, nullcontext, redirect_stderr, redirect_stdout
 from enum import Enum
 from functools import wraps
 from io import StringIO
 from multiprocessing import Pool
 
+import base64
+import copy
+import faulthandler
 import gc
+import hashlib
 import importlib
 import json
 import functools
 import logging
+import math
 import multiprocessing
+import multiprocessing.connection
+import multiprocessing.pool
 import platform
 import random
+import re
 import shutil
 import signal
+import socket
+import struct
 import string
 import tempfile
-import time
+import tracemalloc
 import traceback
 import yaml
 
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+# How long importing Archipelago and its worlds took
+STARTUP_TIME = time.perf_counter() - STARTUP_START
+
 
 OUT_DIR = f"fuzz_output"
 settings.no_gui = True
 settings.skip_autosave = True
 MP_HOOKS = []
-MANAGER = None
+TIMEOUT_QUEUE = None
+# (worker id, results queue) in the workers of an AffinityPool
+AFFINITY_WORKER = None
+# [holds a slot, job of the current run or -1] in the workers of a WatchedPool, shared with the main process
+WORKER_STATE = None
+# setitimer isn't available on Windows, there we can only kill the worker
+CAN_INTERRUPT = hasattr(signal, "setitimer")
+# RLIMIT_AS is what limits the memory of a generation, see --memory-limit
+CAN_LIMIT_MEMORY = resource is not None and hasattr(resource, "RLIMIT_AS")
 
 # This whole thing is to prevent infinite growth of ABC caches
 # See https://github.com/python/cpython/issues/92810
@@ -176,8 +282,27 @@ def world_from_apworld_name(apworld_name):
     raise Exception(f"Couldn't find loaded world with world: {apworld_name}")
 
 
+# Use libyaml when PyYAML was built with it, the pure python emitter and
+# parser are a lot slower. The C emitter wraps long escaped strings at
+# different places but what they parse to is the same.
+YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 # See https://github.com/yaml/pyyaml/issues/103
 yaml.SafeDumper.ignore_aliases = lambda *args: True
+YAML_DUMPER.ignore_aliases = lambda *args: True
+
+
+def dump_yaml(data):
+    return yaml.dump(data, Dumper=YAML_DUMPER, sort_keys=False, allow_unicode=False)
+
+
+def dump_yaml_all(docs):
+    return yaml.dump_all(docs, Dumper=YAML_DUMPER, sort_keys=False, allow_unicode=False)
+
+
+def load_yaml_all(content):
+    return list(yaml.load_all(content, Loader=YAML_LOADER))
 
 
 def _ensure_list(values):
@@ -359,31 +484,84 @@ def _handle_ensure_any(option_value, constraint):
             option_value.append(choice)
 
 
-# Adapted from archipelago'd generate_yaml_templates
-# https://github.com/ArchipelagoMW/Archipelago/blob/f75a1ae1174fb467e5c5bd5568d7de3c806d5b1c/Options.py#L1504
-def generate_random_yaml(world_name, meta):
-    def dictify_range(option):
-        data = {option.default: 50}
-        for sub_option in ["random", "random-low", "random-high"]:
-            if sub_option != option.default:
-                data[sub_option] = 0
-
-        notes = {}
-        for name, number in getattr(option, "special_range_names", {}).items():
-            notes[name] = f"equivalent to {number}"
-            if number in data:
-                data[name] = data[number]
-                del data[number]
-            else:
-                data[name] = 0
+class WorldSampler:
+    """
+    Everything needed to roll random options for a world, computed once by
+    `compile_world_sampler`. Rolling is then just calling the precomputed
+    rollers, no more looking up the world, its option groups or the valid
+    values of each option.
+    """
+    _HEADER_KEYS = ("description", "game", "requires")
+
+    def __init__(self, game_name, option_defs, rollers, game_meta, meta):
+        self.game_name = game_name
+        self.option_defs = option_defs
+        self.rollers = rollers
+        self.game_triggers = game_meta.get("triggers")
+        self.fuzz_constraints = game_meta.get("fuzz_constraints", [])
+        self.triggers = meta.get("triggers")
+        self.description = f"{game_name} Template, generated with https://github.com/Eijebong/Archipelago-fuzzer/tree/{__version__}"
+        self._buffer = []
+        # Everything before the rolled options never changes, render it once
+        self._header = dump_yaml(self._header_content())
+
+    def _header_content(self):
+        return {
+            "description": self.description,
+            "game": self.game_name,
+            "requires": {
+                "version": __ap_version__,
+            },
+        }
+
+    def render(self, yaml_content):
+        """
+        Same as `dump_yaml(yaml_content)` for an option set rolled by this
+        sampler, but only the rolled part actually gets emitted.
+        """
+        return self._header + dump_yaml({
+            key: value for key, value in yaml_content.items() if key not in self._HEADER_KEYS
+        })
+
+    def roll(self):
+        return self._finish({option_name: roller() for option_name, roller in self.rollers})
+
+    def roll_batch(self, k):
+        """
+        Rolls `k` option sets at once. Options are rolled column by column so
+        that the rollers that support it can draw all `k` values in one call.
+        """
+        columns = [
+            (option_name, roller.batch(k) if hasattr(roller, "batch") else [roller() for _ in range(k)])
+            for option_name, roller in self.rollers
+        ]
+        return [self._finish({option_name: column[row] for option_name, column in columns}) for row in range(k)]
 
-        return data, notes
+    def next_options(self, batch_size):
+        if not self._buffer:
+            self._buffer = self.roll_batch(batch_size)
+            self._buffer.reverse()
+        return self._buffer.pop()
 
-    def sanitize(value):
-        if isinstance(value, frozenset):
-            return list(value)
-        return value
+    def _finish(self, game_options):
+        if self.game_triggers is not None:
+            game_options["triggers"] = self.game_triggers
 
+        if self.fuzz_constraints:
+            apply_constraints(game_options, self.fuzz_constraints, self.option_defs)
+
+        yaml_content = self._header_content()
+        yaml_content[self.game_name] = game_options
+
+        if self.triggers is not None:
+            yaml_content["triggers"] = self.triggers
+
+        return yaml_content
+
+
+# Adapted from archipelago'd generate_yaml_templates
+# https://github.com/ArchipelagoMW/Archipelago/blob/f75a1ae1174fb467e5c5bd5568d7de3c806d5b1c/Options.py#L1504
+def compile_world_sampler(world_name, meta):
     game_name, world = world_from_apworld_name(world_name)
     if world is None:
         raise Exception(f"Failed to resolve apworld from apworld name: {world_name}")
@@ -391,7 +569,7 @@ def generate_random_yaml(world_name, meta):
     global_meta = meta.get(None, {})
     game_meta = meta.get(game_name, {})
 
-    game_options = {}
+    rollers = []
     option_defs = {}
     option_groups = get_option_groups(world)
     for group, options in option_groups.items():
@@ -402,35 +580,60 @@ def generate_random_yaml(world_name, meta):
                 override = game_meta.get(option_name)
 
             if override is not None:
-                game_options[option_name] = override
+                rollers.append((option_name, functools.partial(_identity, override)))
                 continue
 
-            game_options[option_name] = sanitize(
-                get_random_value(option_name, option_value)
-            )
+            rollers.append((option_name, compile_option_roller(option_name, option_value)))
 
-    if "triggers" in game_meta:
-        game_options["triggers"] = game_meta["triggers"]
+    return WorldSampler(game_name, option_defs, rollers, game_meta, meta)
 
-    fuzz_constraints = game_meta.get("fuzz_constraints", [])
-    if fuzz_constraints:
-        apply_constraints(game_options, fuzz_constraints, option_defs)
 
-    yaml_content = {
-        "description": f"{game_name} Template, generated with https://github.com/Eijebong/Archipelago-fuzzer/tree/{__version__}",
-        "game": game_name,
-        "requires": {
-            "version": __ap_version__,
-        },
-        game_name: game_options,
-    }
+# Compiled samplers, keyed by apworld name. The main process fills this for
+# the worlds it's going to fuzz before forking, workers compile the others lazily.
+WORLD_SAMPLERS = {}
+
+
+def get_world_sampler(world_name, meta):
+    sampler = WORLD_SAMPLERS.get(world_name)
+    if sampler is None:
+        sampler = compile_world_sampler(world_name, meta)
+        WORLD_SAMPLERS[world_name] = sampler
+    return sampler
+
+
+def generate_random_options(world_name, meta, batch_size=1):
+    sampler = get_world_sampler(world_name, meta)
+    if batch_size > 1:
+        return sampler.next_options(batch_size)
+    return sampler.roll()
+
+
+def generate_random_yaml(world_name, meta):
+    return get_world_sampler(world_name, meta).render(generate_random_options(world_name, meta))
+
+
+def benchmark_samplers(apworld_names, meta, rolls, batch_size):
+    print(f"Rolling {rolls} option sets per world, batches of {batch_size}")
+    print(f"{'world':<30} {'uncompiled':>12} {'compiled':>12} {'batched':>12} {'speedup':>8}")
+    for apworld_name in apworld_names:
+        start = time.perf_counter()
+        for _ in range(rolls):
+            compile_world_sampler(apworld_name, meta).roll()
+        uncompiled = time.perf_counter() - start
 
-    if "triggers" in meta:
-        yaml_content["triggers"] = meta["triggers"]
+        sampler = compile_world_sampler(apworld_name, meta)
+        start = time.perf_counter()
+        for _ in range(rolls):
+            sampler.roll()
+        compiled = time.perf_counter() - start
 
-    res = yaml.safe_dump(yaml_content, sort_keys=False)
+        start = time.perf_counter()
+        for _ in range(rolls):
+            sampler.next_options(batch_size)
+        batched = time.perf_counter() - start
 
-    return res
+        per_roll = 1000000 / rolls
+        print(f"{apworld_name:<30} {uncompiled * per_roll:>10.1f}us {compiled * per_roll:>10.1f}us {batched * per_roll:>10.1f}us {uncompiled / batched:>7.1f}x")
 
 
 _UNSUPPORTED = object()
@@ -495,18 +698,48 @@ def _random_value_for_property(prop, fallback_min, fallback_max):
     return _UNSUPPORTED
 
 
-def get_random_value(name, option):
+def _identity(value):
+    return value
+
+
+def _with_batch(roller, batch):
+    # `batch(k)` rolls k values at once, with the same distribution as calling `roller` k times
+    roller.batch = batch
+    return roller
+
+
+def _batch_choices(population, k):
+    return random.choices(population, k=k)
+
+
+def _batch_samples(keys, k):
+    return [random.sample(keys, k=size) for size in random.choices(range(len(keys) + 1), k=k)]
+
+
+def _constant_roller(value):
+    if isinstance(value, frozenset):
+        # Lists so that it can be dumped, a new one for every roll as constraints modify them
+        values = list(value)
+        return _with_batch(lambda: list(values), lambda k: [list(values) for _ in range(k)])
+    return _with_batch(functools.partial(_identity, value), lambda k: [value] * k)
+
+
+def compile_option_roller(name, option):
+    """
+    Returns a function without arguments that rolls a random value for the option.
+    Everything that doesn't depend on the roll itself is computed here, once.
+    """
     if name == "item_links":
         # Let's not fuck with item links right now, I'm scared
-        return option.default
+        return _constant_roller(option.default)
 
     if name == "megamix_mod_data":
         # Megamix is a special child and requires this to be valid JSON. Since we can't provide that, just ignore it
-        return option.default
+        return _constant_roller(option.default)
 
     if issubclass(option, (PlandoConnections, PlandoTexts)):
         # See, I was already afraid with item_links but now it's plain terror. Let's not ever touch this ever.
-        return option.default
+        return _constant_roller(option.default)
 
     if issubclass(option, OptionCounter):
         # ItemDict subclasses like StartInventory might not have valid_keys and
@@ -517,78 +750,207 @@ def get_random_value(name, option):
         max_val = option.max if option.max is not None else 1000
         if option.valid_keys:
             keys = list(option.valid_keys)
-            selected_keys = random.sample(keys, k=random.randint(0, len(keys)))
-            return {key: random.randint(min_val, max_val) for key in selected_keys}
+
+            def roll_counter():
+                selected_keys = random.sample(keys, k=random.randint(0, len(keys)))
+                return {key: random.randint(min_val, max_val) for key in selected_keys}
+
+            return roll_counter
 
         properties, required, optional = _extract_schema_properties(option)
         if not properties:
-            return option.default
-
-        picked_optional = random.sample(optional, k=random.randint(0, len(optional)))
-        result = {}
-        for key in required + picked_optional:
-            value = _random_value_for_property(properties[key], min_val, max_val)
-            if value is _UNSUPPORTED:
-                has_default = isinstance(option.default, dict) and key in option.default
-                if not has_default and key in required:
-                    return option.default
-                if has_default:
-                    result[key] = option.default[key]
-                continue
-            result[key] = value
-        return result
+            return _constant_roller(option.default)
+
+        default = option.default
+        def roll_schema_counter():
+            picked_optional = random.sample(optional, k=random.randint(0, len(optional)))
+            result = {}
+            for key in required + picked_optional:
+                value = _random_value_for_property(properties[key], min_val, max_val)
+                if value is _UNSUPPORTED:
+                    has_default = isinstance(default, dict) and key in default
+                    if not has_default and key in required:
+                        return default
+                    if has_default:
+                        result[key] = default[key]
+                    continue
+                result[key] = value
+            return result
+
+        return roll_schema_counter
 
     if issubclass(option, OptionDict):
         # This is for example factorio's start_items and worldgen settings. I don't think it's worth randomizing those as I'm not expecting the generation outcome to change from them.
         # Plus I have no idea how to randomize them in the first place :)
-        return option.default
+        return _constant_roller(option.default)
 
     if issubclass(option, (Choice, Toggle)):
         valid_choices = [key for key in option.options.keys() if key not in option.aliases]
         if not valid_choices:
             valid_choices = list(option.options.keys())
 
-        return random.choice(valid_choices)
+        return _with_batch(
+            functools.partial(random.choice, valid_choices),
+            functools.partial(_batch_choices, valid_choices),
+        )
 
     if issubclass(option, Range):
-        return random.randint(option.range_start, option.range_end)
+        return _with_batch(
+            functools.partial(random.randint, option.range_start, option.range_end),
+            functools.partial(_batch_choices, range(option.range_start, option.range_end + 1)),
+        )
 
     if issubclass(option, (ItemSet, LocationSet)):
         # I don't know what to do here so just return the default value instead of a random one.
         # This affects options like local items, non local items so it's not the end of the world
         # if they don't get randomized but we might want to look into that later on
-        return option.default
-
-    if issubclass(option, OptionSet):
-        return random.sample(
-            list(option.valid_keys), k=random.randint(0, len(option.valid_keys))
-        )
+        return _constant_roller(option.default)
 
-    if issubclass(option, OptionList):
-        return random.sample(
-            list(option.valid_keys), k=random.randint(0, len(option.valid_keys))
+    if issubclass(option, (OptionSet, OptionList)):
+        keys = list(option.valid_keys)
+        return _with_batch(
+            lambda: random.sample(keys, k=random.randint(0, len(keys))),
+            functools.partial(_batch_samples, keys),
         )
 
     if issubclass(option, NumericOption):
-        return option("random").value
+        return lambda: option("random").value
 
     if issubclass(option, FreeText):
-        special_symbols = '&<>"\'\\/@#$%^*()[]{}|;:,.'
-        whitespace = ' \t\n'
-        multibyte_utf8 = (
-            'ÀÁÂÃÄÅÆÇÈÉÊËΒΓΔбвг'
-            '中文日本語한글'
-            '🎮🎯🎲🔥💀𝕳𝖊𝖑𝖑𝖔'
-        )
+        return _with_batch(_roll_free_text, _batch_free_text)
+
+    return _constant_roller(option.default)
+
+
+_FREE_TEXT_CHARS = (
+    string.ascii_letters
+    + string.digits
+    # Special symbols
+    + '&<>"\'\\/@#$%^*()[]{}|;:,.'
+    # Whitespace
+    + ' \t\n'
+    # Multibyte UTF-8
+    + 'ÀÁÂÃÄÅÆÇÈÉÊËΒΓΔбвг'
+    + '中文日本語한글'
+    + '🎮🎯🎲🔥💀𝕳𝖊𝖑𝖑𝖔'
+)
+
+
+def _roll_free_text():
+    return "".join(random.choices(_FREE_TEXT_CHARS, k=random.randint(0, 255)))
+
+
+def _batch_free_text(k):
+    return ["".join(random.choices(_FREE_TEXT_CHARS, k=length)) for length in random.choices(range(256), k=k)]
+
+
+def get_random_value(name, option):
+    return compile_option_roller(name, option)()
+
+
+class PlayerFile:
+    """
+    A player file for a single run, kept in memory. `docs` is what Generate
+    would get from parsing the file. `text` is the original content when the
+    file came from disk, rolled files are only rendered when we need to save them.
+    """
+    def __init__(self, name, docs, text=None, renderer=None):
+        self.name = name
+        self.docs = docs
+        self.text = text
+        self.renderer = renderer
+
+    def render(self):
+        if self.text is None:
+            with timed_phase("yaml_dump"):
+                if self.renderer is not None:
+                    self.text = self.renderer(self.docs[0])
+                else:
+                    self.text = dump_yaml_all(self.docs)
+        return self.text
+
+
+def write_player_files(directory, player_files):
+    os.makedirs(directory, exist_ok=True)
+    for player_file in player_files:
+        content = player_file.render().encode("utf-8")
+        with timed_phase("write"):
+            with open(os.path.join(directory, player_file.name), "wb") as fd:
+                fd.write(content)
+
+
+# Generate.main reads player files by scanning `player_files_path` and then
+# parsing every file with read_weights_yamls. Instead of writing YAMLs to disk
+# just to have them parsed back, we register them here under a directory that
+# doesn't exist and make Generate see that directory through its own `os`.
+VIRTUAL_PLAYER_FILES = {}
+
+
+class _VirtualDirEntry:
+    def __init__(self, directory, name):
+        self.name = name
+        self.path = os.path.join(directory, name)
+
+    def is_file(self, *args, **kwargs):
+        return True
 
-        all_chars = string.ascii_letters + string.digits + special_symbols + whitespace + multibyte_utf8
+    def is_dir(self, *args, **kwargs):
+        return False
 
-        return "".join(random.choice(all_chars) for _ in range(random.randint(0, 255)))
 
-    return option.default
+class _VirtualScandir:
+    def __init__(self, entries):
+        self._entries = iter(entries)
 
+    def __iter__(self):
+        return self._entries
 
-def call_generate(yaml_path, args, output_path):
+    def __next__(self):
+        return next(self._entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def close(self):
+        pass
+
+
+class _GenerateOs:
+    def __getattr__(self, name):
+        return getattr(os, name)
+
+    def scandir(self, path="."):
+        if path in VIRTUAL_PLAYER_FILES:
+            return _VirtualScandir(_VirtualDirEntry(path, name) for name in VIRTUAL_PLAYER_FILES[path])
+        return os.scandir(path)
+
+    def listdir(self, path="."):
+        if path in VIRTUAL_PLAYER_FILES:
+            return list(VIRTUAL_PLAYER_FILES[path])
+        return os.listdir(path)
+
+
+def _read_virtual_weights_yamls(path):
+    directory, name = os.path.split(path)
+    if directory in VIRTUAL_PLAYER_FILES:
+        # Generate mutates what it gets so never hand out the docs we might have to save
+        return tuple(copy.deepcopy(VIRTUAL_PLAYER_FILES[directory][name].docs))
+    return _original_read_weights_yamls(path)
+
+
+CAN_USE_VIRTUAL_PLAYER_FILES = hasattr(Generate, "read_weights_yamls")
+# Hooks import this file again as the `fuzz` module, that copy must not
+# replace the patches with its own, empty, VIRTUAL_PLAYER_FILES
+if CAN_USE_VIRTUAL_PLAYER_FILES and Generate.os is os:
+    _original_read_weights_yamls = Generate.read_weights_yamls
+    Generate.read_weights_yamls = _read_virtual_weights_yamls
+    Generate.os = _GenerateOs()
+
+
+def call_generate(yaml_path, args, output_path, seed):
     from settings import get_settings
 
     settings = get_settings()
@@ -598,7 +960,7 @@ def call_generate(yaml_path, args, output_path):
             "weights_file_path": settings.generator.weights_file_path,
             "sameoptions": False,
             "player_files_path": yaml_path,
-            "seed": random.randint(0, 1000000000),
+            "seed": seed,
             "multi": 1,
             "spoiler": 1,
             "outputpath": output_path,
@@ -614,64 +976,598 @@ def call_generate(yaml_path, args, output_path):
             "spoiler_only": False,
         }
     )
-    for hook in MP_HOOKS:
-        hook.before_generate(args)
+    with timed_phase("hooks"):
+        for hook in MP_HOOKS:
+            hook.before_generate(args)
+
+    with timed_phase("gen_main"):
+        erargs, seed = GenMain(args)
+    with timed_phase("er_main"):
+        return ERmain(erargs, seed)
+
+
+class GenerationTimeout(BaseException):
+    """
+    Raised from SIGALRM in a worker when a generation exceeds the timeout.
+    This is a BaseException so that worlds catching `Exception` don't swallow it.
+    """
+    pass
+
+
+# Stacks of the generation taken as it's about to time out, with how long it
+# had been running at the time
+HANG_SNAPSHOTS = []
+HANG_SNAPSHOT_COUNT = 5
+# The snapshots are spread over the end of the timeout, the last one is taken
+# right before interrupting the generation
+HANG_SNAPSHOT_WINDOW = 0.2
+HANG_START = None
+# faulthandler writes here if the generation doesn't even stop when killed
+HANG_FILE = None
+
+
+def _generation_stack(frame):
+    # Only keep the frames from call_generate inwards, the pool machinery is the same for every run
+    frames = []
+    for f, lineno in traceback.walk_stack(frame):
+        frames.append((f, lineno))
+        if f.f_code is call_generate.__code__:
+            break
+    return traceback.StackSummary.extract(reversed(frames))
+
+
+def _on_generation_alarm(signum, frame):
+    HANG_SNAPSHOTS.append((time.perf_counter() - HANG_START, _generation_stack(frame)))
+    if len(HANG_SNAPSHOTS) >= HANG_SNAPSHOT_COUNT:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        raise GenerationTimeout()
+
+
+def arm_generation_alarm(timeout):
+    global HANG_START
+    HANG_SNAPSHOTS.clear()
+    HANG_START = time.perf_counter()
+    interval = timeout * HANG_SNAPSHOT_WINDOW / (HANG_SNAPSHOT_COUNT - 1)
+    signal.setitimer(signal.ITIMER_REAL, timeout - interval * (HANG_SNAPSHOT_COUNT - 1), interval)
+
+
+def snapshot_main_thread():
+    """Called from the timeout timer when the generation didn't stop"""
+    frame = sys._current_frames().get(threading.main_thread().ident)
+    if frame is not None and HANG_START is not None:
+        HANG_SNAPSHOTS.append((time.perf_counter() - HANG_START, _generation_stack(frame)))
+
+
+def format_hang_snapshots():
+    out = []
+    for n, (elapsed, stack) in enumerate(HANG_SNAPSHOTS, 1):
+        out.append(f"Snapshot {n}/{len(HANG_SNAPSHOTS)}, {elapsed:.2f}s into the generation:\n")
+        out.extend(traceback.format_list(stack))
+        out.append("\n")
+    if HANG_FILE is not None:
+        HANG_FILE.seek(0)
+        dumped = HANG_FILE.read().decode("utf-8", errors="replace")
+        if dumped:
+            out.append("Dumped by faulthandler while the generation wasn't stopping:\n")
+            out.append(dumped)
+    return "".join(out)
+
+
+# Time spent in every stage of the generation by game, for the run this worker is doing
+RUN_STAGES = None
+# Fill functions that Main calls and that get timed like stages
+FILL_STAGES = {
+    "distribute_items_restrictive": "fill",
+    "balance_multiworld_progression": "progression_balancing",
+}
+
+
+def _record_stage(game, stage, duration):
+    if RUN_STAGES is not None:
+        game_stages = RUN_STAGES.setdefault(game, {})
+        game_stages[stage] = game_stages.get(stage, 0) + duration
+
+
+def _timed_stage(func, stage):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            # Stages that run for all games at once aren't attributed to a game
+            _record_stage("*", stage, time.perf_counter() - start)
+    return wrapper
+
+
+def install_stage_timers():
+    """
+    Wraps AutoWorld.call_single and AutoWorld.call_stage to time every stage
+    of the generation for each game, and the fill functions used by Main.
+    `stage_*` methods run once per world class, they're timed for each of
+    them rather than all at once.
+    """
+    original_call_single = AutoWorld.call_single
+    original_call_stage = AutoWorld.call_stage
+
+    @wraps(original_call_single)
+    def timed_call_single(multiworld, method_name, player, *args):
+        start = time.perf_counter()
+        try:
+            return original_call_single(multiworld, method_name, player, *args)
+        finally:
+            _record_stage(multiworld.game[player], method_name, time.perf_counter() - start)
+
+    @wraps(original_call_stage)
+    def timed_call_stage(multiworld, method_name, *args):
+        # Same as AutoWorld.call_stage, one world class at a time
+        world_types = {multiworld.worlds[player].__class__ for player in multiworld.player_ids}
+        for world_type in sorted(world_types, key=lambda world: world.__name__):
+            stage_callable = getattr(world_type, f"stage_{method_name}", None)
+            if stage_callable:
+                start = time.perf_counter()
+                try:
+                    stage_callable(multiworld, *args)
+                finally:
+                    _record_stage(world_type.game, f"stage_{method_name}", time.perf_counter() - start)
+
+    AutoWorld.call_single = timed_call_single
+    AutoWorld.call_stage = timed_call_stage
+
+    for name, stage in FILL_STAGES.items():
+        func = getattr(Main, name, None)
+        if func is not None:
+            setattr(Main, name, _timed_stage(func, stage))
+
+
+# Samples taken during the generation this worker is doing, by stack of code
+# objects, when --sample-profile is set
+RUN_PROFILE = None
+SAMPLING = False
+
+
+def _sample_stack(frame):
+    stack = []
+    while frame is not None and frame.f_code is not call_generate.__code__:
+        stack.append(frame.f_code)
+        frame = frame.f_back
+    # Outside of the generation itself
+    if frame is None:
+        return None
+    return tuple(stack)
+
+
+def _take_sample(signum, frame):
+    if RUN_PROFILE is None:
+        return
+
+    key = _sample_stack(frame)
+    if key is not None:
+        RUN_PROFILE[key] = RUN_PROFILE.get(key, 0) + 1
+
+
+def start_sampling(rate):
+    """Samples the stack of this process `rate` times per second of CPU time"""
+    global SAMPLING
+    if not SAMPLING:
+        signal.signal(signal.SIGPROF, _take_sample)
+        signal.setitimer(signal.ITIMER_PROF, 1 / rate, 1 / rate)
+        SAMPLING = True
+
+
+# How many times per second the stack of a slow generation is sampled
+SLOW_SAMPLE_RATE = 100
+
+
+class SlowSampler(threading.Thread):
+    """
+    Samples the stack of the generation running on the thread that created
+    it, in wall time, once it has been running for longer than `delay`.
+    Used to profile the generations that turn out to be slow.
+    """
+    def __init__(self, delay, rate=SLOW_SAMPLE_RATE):
+        super().__init__(daemon=True)
+        self.delay = delay
+        self.interval = 1 / rate
+        self.samples = {}
+        self.target = threading.get_ident()
+        self.stopped = threading.Event()
+
+    def run(self):
+        if self.stopped.wait(self.delay):
+            return
+        while not self.stopped.is_set():
+            key = _sample_stack(sys._current_frames().get(self.target))
+            if key is not None:
+                self.samples[key] = self.samples.get(key, 0) + 1
+            self.stopped.wait(self.interval)
+
+    def finish(self):
+        self.stopped.set()
+        self.join()
+        return self.samples
+
+
+def slow_signature(samples):
+    """
+    Signature of a slow generation, from the innermost frames of the stack it
+    was sampled in the most so that runs slow for the same reason end up together
+    """
+    frames = []
+    if samples:
+        fuzzer_file = os.path.abspath(__file__)
+        stack = max(samples.items(), key=lambda item: item[1])[0]
+        stack = [code for code in stack if os.path.abspath(code.co_filename) != fuzzer_file]
+        for code in reversed(stack[:SIGNATURE_FRAMES]):
+            path = os.path.normpath(code.co_filename).split(os.sep)
+            frames.append(f"{'/'.join(path[-2:])}:{code.co_name}")
+
+    key = "\n".join([str(GenOutcome.Slow), "Slow", ""] + frames)
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    return FailureSignature(digest, "Slow", "", frames)
+
+
+def _code_label(code):
+    path = os.path.normpath(code.co_filename).split(os.sep)
+    return f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+
+def collapse_samples(samples):
+    """Turns samples into collapsed stacks, outermost frame first, as used by flamegraph tools"""
+    collapsed = Counter()
+    for stack, count in samples.items():
+        collapsed[";".join(_code_label(code) for code in reversed(stack))] += count
+    return collapsed
+
+
+def write_callgrind(path, collapsed):
+    """Writes collapsed stacks in the callgrind format, with one sample as the cost unit"""
+    self_cost = Counter()
+    calls = defaultdict(Counter)
+    for stack, count in collapsed.items():
+        frames = stack.split(";")
+        self_cost[frames[-1]] += count
+        # Recursive calls only count once per sample
+        for edge in set(zip(frames, frames[1:])):
+            calls[edge[0]][edge[1]] += count
+
+    def location(frame):
+        name, _, file_line = frame.rpartition(" (")
+        return file_line.rsplit(":", 1)[0], name
+
+    with open(path, "w", encoding="utf-8") as fd:
+        fd.write("# callgrind format\nversion: 1\ncreator: apfuzz\nevents: Samples\n\n")
+        for frame in set(self_cost) | set(calls):
+            filename, name = location(frame)
+            fd.write(f"fl={filename}\nfn={name}\n0 {self_cost[frame]}\n")
+            for callee, count in calls[frame].items():
+                callee_filename, callee_name = location(callee)
+                fd.write(f"cfl={callee_filename}\ncfn={callee_name}\ncalls={count} 0\n0 {count}\n")
+            fd.write("\n")
+
+
+def write_profiles():
+    profile_dir = os.path.join(OUT_DIR, "profile")
+    os.makedirs(profile_dir, exist_ok=True)
+    for apworld_name, collapsed in PROFILES.items():
+        with open(os.path.join(profile_dir, f"{apworld_name}.collapsed"), "w", encoding="utf-8") as fd:
+            for stack, count in collapsed.items():
+                fd.write(f"{stack} {count}\n")
+        write_callgrind(os.path.join(profile_dir, f"callgrind.out.{apworld_name}"), collapsed)
+
+
+def reset_peak_rss():
+    """Resets the peak RSS of this process, returns False where that isn't possible (outside of Linux)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as fd:
+            fd.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def read_memory_status(field):
+    """Reads a memory field of /proc/self/status (VmHWM, VmSize...), in bytes"""
+    with open("/proc/self/status", "r") as fd:
+        for line in fd:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) * 1024
+    return None
+
+
+class MemoryLimit:
+    """
+    Limits the address space this process can grow by while a generation
+    runs, allocations past it raise MemoryError in the generation.
+    """
+    def __init__(self, limit_mb):
+        self.limit = limit_mb * 1024 * 1024
+        self.previous = None
+
+    def __enter__(self):
+        soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+        self.previous = soft
+        # What the worker already has mapped doesn't count towards the limit
+        limit = read_memory_status("VmSize") + self.limit
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+        return self
+
+    def __exit__(self, *exc):
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS, (self.previous, hard))
+
+
+def init_worker(timeout_queue, out_dir, recycle_rss=None, recycle_after=None, warm_up=None):
+    global TIMEOUT_QUEUE, OUT_DIR, HANG_FILE, RECYCLE_RSS, RECYCLE_AFTER
+    TIMEOUT_QUEUE = timeout_queue
+    OUT_DIR = out_dir
+    RECYCLE_RSS = recycle_rss * 1024 * 1024 if recycle_rss else None
+    RECYCLE_AFTER = recycle_after
+    HANG_FILE = tempfile.TemporaryFile()
+    install_stage_timers()
+    if CAN_INTERRUPT:
+        signal.signal(signal.SIGALRM, _on_generation_alarm)
+    if warm_up is not None:
+        warm_up_worker(*warm_up)
+
+
+def freeze_before_fork():
+    """
+    Moves everything the main process allocated so far to the GC's permanent
+    generation. Collections in the workers then don't write to the headers of
+    those objects, which keeps the pages they're in shared with the main
+    process instead of copying them in every worker. The GC is disabled
+    until then so that it doesn't free objects in the middle of those pages
+    for the workers to write new ones in.
+    """
+    gc.freeze()
+    gc.enable()
+
+
+# Worlds this worker already ran, their first run pays for lazy imports and cold caches
+WORLDS_RUN = set()
+
+
+def warm_up_worker(args, tmp):
+    """
+    Runs a throwaway generation of every game selected with -g, so that the
+    lazy imports and caches a world fills on its first generation are paid
+    here instead of in the first run of the worker.
+    """
+    for apworld_name in dict.fromkeys(args.game):
+        WORLDS_RUN.add(apworld_name)
+        # A previous worker got stuck warming this game up, the runs will time out on their own
+        stuck_marker = os.path.join(tmp, f"apfuzz-warmup-stuck-{apworld_name}")
+        if os.path.exists(stuck_marker):
+            continue
+
+        def stuck():
+            open(stuck_marker, "w").close()
+            # This worker never took a slot or a run, exiting cleanly lets the pool replace it
+            os._exit(0)
+
+        yaml_path = os.path.join(tmp, f"apfuzz-warmup-{os.getpid()}")
+        timer = threading.Timer(args.timeout + args.timeout_grace, stuck) if args.timeout > 0 else None
+        try:
+            with redirect_stdout(StringIO()), redirect_stderr(StringIO()), tempfile.TemporaryDirectory(prefix="apfuzz", dir=tmp) as output_path:
+                job = RunDescriptor(-1, [apworld_name], 1, random.getrandbits(64))
+                player_files = roll_player_files(job, args)
+                if CAN_USE_VIRTUAL_PLAYER_FILES:
+                    VIRTUAL_PLAYER_FILES[yaml_path] = {player_file.name: player_file for player_file in player_files}
+                else:
+                    write_player_files(yaml_path, player_files)
+                patched_init_logging("Fuzzer")
+                if timer is not None:
+                    timer.start()
+                try:
+                    if CAN_INTERRUPT and args.timeout > 0:
+                        arm_generation_alarm(args.timeout)
+                    call_generate(yaml_path, args, output_path, random.randint(0, 1000000000))
+                finally:
+                    if CAN_INTERRUPT:
+                        signal.setitimer(signal.ITIMER_REAL, 0)
+        except (Exception, GenerationTimeout):
+            # Failing is as good a warm up as any
+            pass
+        finally:
+            if timer is not None:
+                timer.cancel()
+            VIRTUAL_PLAYER_FILES.pop(yaml_path, None)
+            shutil.rmtree(yaml_path, ignore_errors=True)
+            clear_abc_caches()
+            root_logger = logging.getLogger()
+            for handler in root_logger.handlers[:]:
+                root_logger.removeHandler(handler)
+                handler.close()
+
+
+def read_pss(pid):
+    """Proportional set size of a process in bytes, None outside of Linux"""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as fd:
+            for line in fd:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class PhaseTimings:
+    """
+    Time spent in each phase of a run. Phases can be nested, the time spent
+    in an inner phase only counts for that phase.
+    """
+    def __init__(self):
+        self.durations = {}
+        self._stack = []
+        self._start = time.perf_counter()
+
+    def _charge(self, now):
+        if self._stack:
+            name = self._stack[-1]
+            self.durations[name] = self.durations.get(name, 0) + now - self._start
+        self._start = now
+
+    @contextmanager
+    def phase(self, name):
+        self._charge(time.perf_counter())
+        self._stack.append(name)
+        try:
+            yield
+        finally:
+            self._charge(time.perf_counter())
+            self._stack.pop()
+
 
-    erargs, seed = GenMain(args)
-    return ERmain(erargs, seed)
+# Timings of the run this worker is currently doing
+RUN_TIMINGS = None
 
 
-def gen_wrapper(yaml_path, apworld_name, i, args, queue, tmp):
-    global MP_HOOKS
+def timed_phase(name):
+    if RUN_TIMINGS is None:
+        return nullcontext()
+    return RUN_TIMINGS.phase(name)
 
+
+def gen_wrapper(yaml_path, job, apworld_name, args, tmp):
+    global MP_HOOKS, RUN_TIMINGS, RUN_STAGES, RUN_PROFILE
+
+    i = job.i
     out_buf = StringIO()
+    start = time.perf_counter()
+    RUN_TIMINGS = PhaseTimings()
+    RUN_STAGES = {}
+    if job.submitted_at is not None:
+        RUN_TIMINGS.durations["queue_wait"] = max(time.time() - job.submitted_at, 0)
+    first_run = apworld_name not in WORLDS_RUN
+    WORLDS_RUN.add(apworld_name)
 
     timer = None
+    interrupt = CAN_INTERRUPT and args.timeout > 0
     if args.timeout > 0:
-        myself = os.getpid()
         def stop():
-            queue.put_nowait((myself, apworld_name, i, yaml_path, out_buf))
-            queue.join()
-        timer = threading.Timer(args.timeout, stop)
+            # The generation didn't stop when interrupted (or we can't
+            # interrupt it at all), hand it over to the main process and kill
+            # ourselves. The pool will replace this worker.
+            # We exit from here rather than letting the main process kill us
+            # so that we can't die while holding the queue lock.
+            if virtual:
+                write_player_files(yaml_path, player_files)
+            write_generation_seed(yaml_path, gen_seed)
+            snapshot_main_thread()
+            signature = None
+            if HANG_SNAPSHOTS:
+                signature = hang_signature(GenOutcome.Timeout, [stack for _, stack in HANG_SNAPSHOTS])
+                signature.reproducer = job.dump and claim_reproducer_slot(signature, i, args.keep_reproducers)
+            if signature is None or signature.reproducer:
+                with open(os.path.join(yaml_path, f"{i}.stacks.txt"), "w", encoding="utf-8") as fd:
+                    fd.write(format_hang_snapshots())
+            TIMEOUT_QUEUE.put((apworld_name, i, yaml_path, out_buf, signature))
+            if AFFINITY_WORKER is not None:
+                # The run isn't lost, the main process reports it as a timeout
+                worker_id, results = AFFINITY_WORKER
+                results.put(("handed_over", worker_id))
+            if WORKER_STATE is not None:
+                WORKER_STATE[1] = -1
+            os._exit(1)
+        # When we can interrupt the generation, the timer is only there as a last resort
+        kill_after = args.timeout + args.timeout_grace if interrupt else args.timeout
+        timer = threading.Timer(kill_after, stop)
 
 
     raised = None
     mw = None
+    player_files = []
+    virtual = False
+    gen_seed = None
+    profile = None
+    slow_sampler = None
+    slow_samples = None
+    peak_rss = None
+    traced_peak = None
 
     try:
         with redirect_stdout(out_buf), redirect_stderr(out_buf), tempfile.TemporaryDirectory(prefix="apfuzz", dir=tmp) as output_path:
-            try:
-                # If we have hooks defined in args but they're not registered yet, register them
-                if args.hook and not MP_HOOKS:
-                    for hook_class_path in args.hook:
-                        hook = find_hook(hook_class_path)
-                        hook.setup_worker(args)
-                        MP_HOOKS.append(hook)
+            # If we have hooks defined in args but they're not registered yet, register them
+            if args.hook and not MP_HOOKS:
+                for hook_class_path in args.hook:
+                    hook = find_hook(hook_class_path)
+                    hook.setup_worker(args)
+                    MP_HOOKS.append(hook)
+
+            # Failing to roll YAMLs is a fuzzer problem, not a generation
+            # failure so let that go through the error callback
+            with timed_phase("roll"):
+                player_files = roll_player_files(job, args)
+            gen_seed = job.gen_seed if job.gen_seed is not None else random.randint(0, 1000000000)
+            virtual = CAN_USE_VIRTUAL_PLAYER_FILES and not any(hook.needs_player_files for hook in MP_HOOKS)
+            if virtual:
+                VIRTUAL_PLAYER_FILES[yaml_path] = {player_file.name: player_file for player_file in player_files}
+            else:
+                write_player_files(yaml_path, player_files)
 
+            try:
                 # Since 74f41e37, Generate.main no longer calls init_logging
                 # when imported as a module, so we have to do it ourselves.
                 patched_init_logging("Fuzzer")
 
                 if timer:
                     timer.start()
-
-                mw = call_generate(yaml_path, args, output_path)
-            except Exception as e:
+                    # Works even if the generation is stuck holding the GIL
+                    HANG_FILE.seek(0)
+                    HANG_FILE.truncate()
+                    faulthandler.dump_traceback_later(kill_after * 0.95, file=HANG_FILE)
+
+                if args.sample_profile:
+                    start_sampling(args.sample_profile)
+                    RUN_PROFILE = {}
+                if job.slow_after is not None:
+                    slow_sampler = SlowSampler(max(job.slow_after - (time.perf_counter() - start), 0))
+                    slow_sampler.start()
+                if args.tracemalloc:
+                    if not tracemalloc.is_tracing():
+                        tracemalloc.start()
+                    tracemalloc.reset_peak()
+                tracks_rss = reset_peak_rss()
+                try:
+                    with MemoryLimit(args.memory_limit) if args.memory_limit else nullcontext():
+                        if interrupt:
+                            arm_generation_alarm(args.timeout)
+                        mw = call_generate(yaml_path, args, output_path, gen_seed)
+                finally:
+                    if interrupt:
+                        signal.setitimer(signal.ITIMER_REAL, 0)
+                    if tracks_rss:
+                        peak_rss = read_memory_status("VmHWM")
+                    if args.tracemalloc:
+                        traced_peak = tracemalloc.get_traced_memory()[1]
+                    if RUN_PROFILE is not None:
+                        profile = collapse_samples(RUN_PROFILE)
+                        RUN_PROFILE = None
+                    if slow_sampler is not None:
+                        slow_samples = slow_sampler.finish()
+            except (Exception, GenerationTimeout) as e:
                 raised = e
             finally:
                 try:
-                    for hook in MP_HOOKS:
-                        hook.after_generate(mw, output_path)
+                    with timed_phase("hooks"):
+                        for hook in MP_HOOKS:
+                            hook.after_generate(mw, output_path)
                 finally:
                     # Make sure to always stop the timeout timer, whatever happens
                     # If we don't, the timer could fire while we're stopping AP or
                     # dumping YAMLs, and that would be bad.
                     if timer is not None:
+                        faulthandler.cancel_dump_traceback_later()
                         timer.cancel()
                         if timer.ident is not None:
                             timer.join()
 
                     clear_abc_caches()
+                    VIRTUAL_PLAYER_FILES.pop(yaml_path, None)
 
                 root_logger = logging.getLogger()
                 handlers = root_logger.handlers[:]
@@ -679,61 +1575,129 @@ def gen_wrapper(yaml_path, apworld_name, i, args, queue, tmp):
                     root_logger.removeHandler(handler)
                     handler.close()
 
-                outcome = GenOutcome.Success
-                if raised:
-                    is_timeout = isinstance(raised, TimeoutError)
-                    is_option_error = exception_in_causes(raised, OptionError)
-                    if not is_option_error and isinstance(raised, PlayerFilesError):
-                        is_option_error = all(
-                            exception_in_causes(e, OptionError) for e in raised.exceptions
-                        )
-
-                    if is_timeout:
-                        outcome = GenOutcome.Timeout
-                    elif is_option_error:
-                        outcome = GenOutcome.OptionError
-                    else:
-                        outcome = GenOutcome.Failure
-
-                for hook in MP_HOOKS:
-                    outcome, raised = hook.reclassify_outcome(outcome, raised)
+                with timed_phase("classify"):
+                    outcome = GenOutcome.Success
+                    if raised:
+                        is_timeout = isinstance(raised, (TimeoutError, GenerationTimeout))
+                        # Without a limit, a MemoryError is the world's own bug
+                        is_oom = bool(args.memory_limit) and exception_in_causes(raised, MemoryError)
+                        is_option_error = exception_in_causes(raised, OptionError)
+                        if not is_option_error and isinstance(raised, PlayerFilesError):
+                            is_option_error = all(
+                                exception_in_causes(e, OptionError) for e in raised.exceptions
+                            )
+
+                        if is_timeout:
+                            outcome = GenOutcome.Timeout
+                        elif is_oom:
+                            outcome = GenOutcome.OutOfMemory
+                        elif is_option_error:
+                            outcome = GenOutcome.OptionError
+                        else:
+                            outcome = GenOutcome.Failure
+                    elif job.slow_after is not None and time.perf_counter() - start > job.slow_after:
+                        outcome = GenOutcome.Slow
+
+                with timed_phase("hooks"):
+                    for hook in MP_HOOKS:
+                        outcome, raised = hook.reclassify_outcome(outcome, raised)
 
+                # The phases keep being timed until the result gets sent back
+                result = RunResult(
+                    outcome, None, time.perf_counter() - start, gen_seed, job.games,
+                    phases=RUN_TIMINGS.durations, stages=RUN_STAGES, profile=profile,
+                    peak_rss=peak_rss, traced_peak=traced_peak, first_run=first_run,
+                )
                 if outcome == GenOutcome.Success:
-                    return outcome
-
-                if outcome == GenOutcome.OptionError and not args.dump_ignored:
-                    return outcome
-
-                if outcome == GenOutcome.Timeout:
-                    extra = f"[...] Generation killed here after {args.timeout}s"
-                elif isinstance(raised, PlayerFilesError):
-                    extra = str(raised)
-                else:
-                    extra = "".join(traceback.format_exception(raised))
-
-                dump_generation_output(outcome, apworld_name, i, yaml_path, out_buf, extra)
+                    return result
 
-                return outcome, raised
+                with timed_phase("classify"):
+                    if outcome == GenOutcome.Slow:
+                        result.signature = signature = slow_signature(slow_samples)
+                    else:
+                        result.signature = signature = failure_signature(outcome, raised)
+                    if not job.dump or (outcome == GenOutcome.OptionError and not args.dump_ignored):
+                        signature.reproducer = False
+                        return result
+
+                    signature.reproducer = claim_reproducer_slot(signature, i, args.keep_reproducers)
+                    # Past the first few reproducers, the main process only counts them
+                    if not signature.reproducer:
+                        return result
+
+                with timed_phase("dump"):
+                    if outcome == GenOutcome.Timeout:
+                        extra = "".join(traceback.format_exception(raised))
+                        extra += f"[...] Generation interrupted here after {args.timeout}s"
+                    elif outcome == GenOutcome.OutOfMemory:
+                        extra = "".join(traceback.format_exception(raised))
+                        extra += f"[...] Generation ran out of memory, past its {args.memory_limit} MiB limit"
+                    elif outcome == GenOutcome.Slow:
+                        extra = f"[...] Generation took {result.duration:.2f}s, slow for {apworld_name} past {job.slow_after:.2f}s"
+                    elif isinstance(raised, PlayerFilesError):
+                        extra = str(raised)
+                    else:
+                        extra = "".join(traceback.format_exception(raised))
+
+                    dump_generation_output(outcome, apworld_name, i, yaml_path, out_buf, extra, player_files, gen_seed)
+                    if outcome == GenOutcome.Timeout and HANG_SNAPSHOTS:
+                        stacks_path = os.path.join(generation_output_dir(outcome, apworld_name, i), f"{i}.stacks.txt")
+                        with open(stacks_path, "w", encoding="utf-8") as fd:
+                            fd.write(format_hang_snapshots())
+                    if outcome == GenOutcome.Slow and slow_samples:
+                        profile_path = os.path.join(generation_output_dir(outcome, apworld_name, i), f"{i}.collapsed")
+                        with open(profile_path, "w", encoding="utf-8") as fd:
+                            for stack, count in collapse_samples(slow_samples).items():
+                                fd.write(f"{stack} {count}\n")
+
+                return result
     except Exception as e:
+        # The main process will dump this run from the YAMLs directory
+        if virtual:
+            try:
+                write_player_files(yaml_path, player_files)
+            except Exception:
+                pass
         raise FuzzerException("Fuzzer error", out_buf) from e
 
 
-def dump_generation_output(outcome, apworld_name, i, yamls_dir, out_buf, extra=None):
-    if outcome == GenOutcome.Success:
-        return
+def write_generation_seed(directory, seed):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "seed.txt"), "w", encoding="utf-8") as fd:
+        fd.write(f"{seed}\n")
+
 
+def generation_output_dir(outcome, apworld_name, i):
     if outcome == GenOutcome.OptionError:
         error_ty = "ignored"
     elif outcome == GenOutcome.Timeout:
         error_ty = "timeout"
+    elif outcome == GenOutcome.Slow:
+        error_ty = "slow"
+    elif outcome == GenOutcome.OutOfMemory:
+        error_ty = "oom"
     else:
         error_ty = "error"
 
-    error_output_dir = os.path.join(OUT_DIR, error_ty, apworld_name, str(i))
-    os.makedirs(error_output_dir)
+    return os.path.join(OUT_DIR, error_ty, apworld_name, str(i))
 
-    for yaml_file in os.listdir(yamls_dir):
-        shutil.copy(os.path.join(yamls_dir, yaml_file), error_output_dir)
+
+def dump_generation_output(outcome, apworld_name, i, yamls_dir, out_buf, extra=None, player_files=None, seed=None):
+    if outcome == GenOutcome.Success:
+        return
+
+    error_output_dir = generation_output_dir(outcome, apworld_name, i)
+    # Runs dumped after the last checkpoint are run again when resuming
+    os.makedirs(error_output_dir, exist_ok=True)
+
+    # The worker might have crashed before it got to write the YAMLs
+    if player_files is not None and not os.path.isdir(yamls_dir):
+        write_player_files(error_output_dir, player_files)
+    elif os.path.isdir(yamls_dir):
+        for yaml_file in os.listdir(yamls_dir):
+            shutil.copy(os.path.join(yamls_dir, yaml_file), error_output_dir)
+    if seed is not None:
+        write_generation_seed(error_output_dir, seed)
 
     error_log_path = os.path.join(error_output_dir, f"{i}.log")
     with open(error_log_path, "w", encoding='utf-8') as fd:
@@ -742,11 +1706,1125 @@ def dump_generation_output(outcome, apworld_name, i, yamls_dir, out_buf, extra=N
             fd.write(extra)
 
 
+# How many of the innermost frames of a traceback go in a failure signature
+SIGNATURE_FRAMES = 5
+_MESSAGE_NORMALIZERS = [
+    (re.compile(r"0x[0-9a-fA-F]+"), "0x?"),
+    (re.compile(r"'[^'\n]*'|\"[^\"\n]*\""), "'?'"),
+    (re.compile(r"\d+"), "N"),
+]
+# Signatures this worker already knows have all their reproducers
+FULL_SIGNATURES = set()
+
+
+def normalize_message(message):
+    for pattern, replacement in _MESSAGE_NORMALIZERS:
+        message = pattern.sub(replacement, message)
+    return message
+
+
+class FailureSignature:
+    """
+    What the main process gets back for a failed generation instead of the
+    exception itself. `digest` identifies the failure across runs, it's a
+    hash of the exception type, its normalized message and the innermost
+    frames of its traceback. `reproducer` is True if the run was dumped.
+    """
+    def __init__(self, digest, exc_type, message, frames, reproducer=True):
+        self.digest = digest
+        self.exc_type = exc_type
+        self.message = message
+        self.frames = frames
+        self.reproducer = reproducer
+
+
+def _root_cause(exc):
+    while True:
+        if isinstance(exc, PlayerFilesError) and getattr(exc, "exceptions", None):
+            exc = exc.exceptions[0]
+        elif exc.__cause__ is not None:
+            exc = exc.__cause__
+        else:
+            return exc
+
+
+def _signature_frames(stack):
+    # Line numbers are left out so that unrelated changes to a file don't change the signature
+    fuzzer_file = os.path.abspath(__file__)
+    frames = []
+    for frame in stack:
+        if os.path.abspath(frame.filename) == fuzzer_file:
+            continue
+        path = os.path.normpath(frame.filename).split(os.sep)
+        frames.append(f"{'/'.join(path[-2:])}:{frame.name}")
+    return frames
+
+
+def hang_signature(outcome, stacks):
+    """
+    Signature of a generation that timed out, from the stack snapshots taken
+    before it was stopped. The hot frames are the innermost ones that all the
+    snapshots share, the function that's looping rather than wherever it
+    happened to be when the timer fired.
+    """
+    hot = []
+    for frames in zip(*(_signature_frames(stack) for stack in stacks)):
+        if any(frame != frames[0] for frame in frames):
+            break
+        hot.append(frames[0])
+    frames = hot[-SIGNATURE_FRAMES:]
+
+    key = "\n".join([str(outcome), "TimeoutError", ""] + frames)
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    return FailureSignature(digest, "TimeoutError", "", frames)
+
+
+def failure_signature(outcome, raised):
+    if raised is None:
+        # A hook turned a successful generation into a failure
+        return FailureSignature(f"{outcome}-no-exception", "", "", [])
+
+    if outcome == GenOutcome.Timeout and HANG_SNAPSHOTS:
+        return hang_signature(outcome, [stack for _, stack in HANG_SNAPSHOTS])
+
+    root = _root_cause(raised)
+    frames = _signature_frames(traceback.extract_tb(root.__traceback__))[-SIGNATURE_FRAMES:]
+
+    exc_type = type(root).__name__
+    message = "" if outcome == GenOutcome.Timeout else normalize_message(str(root))
+    key = "\n".join([str(outcome), exc_type, message] + frames)
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    return FailureSignature(digest, exc_type, message, frames)
+
+
+def claim_reproducer_slot(signature, i, keep):
+    """
+    Tries to claim one of the `keep` reproducer slots of a signature. Slots
+    are files created exclusively in the signature directory so that workers
+    never race for them. Returns True if the run should be dumped.
+    """
+    if keep <= 0:
+        return True
+    if signature.digest in FULL_SIGNATURES:
+        return False
+
+    signature_dir = os.path.join(OUT_DIR, "signatures", signature.digest)
+    os.makedirs(signature_dir, exist_ok=True)
+    for slot in range(keep):
+        try:
+            fd = os.open(os.path.join(signature_dir, f"reproducer-{slot}"), os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except FileExistsError:
+            continue
+
+        with os.fdopen(fd, "w") as slot_file:
+            slot_file.write(f"{i}\n")
+        if slot == 0:
+            with open(os.path.join(signature_dir, "signature.txt"), "w", encoding="utf-8") as fd:
+                fd.write(f"{signature.exc_type}: {signature.message}\n")
+                fd.write("\n".join(signature.frames))
+                fd.write("\n")
+        return True
+
+    FULL_SIGNATURES.add(signature.digest)
+    return False
+
+
+class RunResult:
+    """
+    What the main process gets back from a run. `signature` is only set when
+    the run didn't succeed, `killed` when its worker had to be killed.
+    `peak_rss` and `traced_peak` are in bytes. `recycled` is why the worker
+    exited after the run, if it did. `first_run` is set on the first run of
+    its world in the worker.
+    """
+    def __init__(self, outcome, signature=None, duration=None, seed=None, games=None, killed=False, phases=None, stages=None, profile=None, peak_rss=None, traced_peak=None, recycled=None, first_run=False):
+        self.outcome = outcome
+        self.signature = signature
+        self.duration = duration
+        self.seed = seed
+        self.games = games
+        self.killed = killed
+        self.phases = phases
+        self.stages = stages
+        self.profile = profile
+        self.peak_rss = peak_rss
+        self.traced_peak = traced_peak
+        self.recycled = recycled
+        self.first_run = first_run
+
+
 class GenOutcome:
     Success = 0
     Failure = 1
     Timeout = 2
     OptionError = 3
+    # Succeeded, but took much longer than usual for its world
+    Slow = 4
+    # Went past --memory-limit
+    OutOfMemory = 5
+
+
+class RunDescriptor:
+    """
+    Everything a worker needs to roll the YAMLs of a single run by itself.
+    The main process only decides which games are played, how many YAMLs each
+    of them gets and the seed. Rolling the options happens in the worker.
+    When `samples` is set (--sample-from), it contains `(filename, sample)`
+    pairs of corpus files the worker loads, from its own --sample-from
+    directory, instead of rolling random YAMLs.
+    When `player_files` is set (--minimize), it contains `(filename, docs)`
+    pairs that are used as is, static worlds included.
+    `gen_seed` forces the generation seed and `dump` can be set to False to
+    only get the signature of a failure back. `submitted_at` is the time at
+    which the run was handed to the pool, to measure how long it waited.
+    A successful run that takes longer than `slow_after` seconds is slow.
+    """
+    def __init__(self, i, games, yamls_per_game, seed, samples=None, player_files=None, gen_seed=None, dump=True, submitted_at=None, slow_after=None):
+        self.i = i
+        self.games = games
+        self.yamls_per_game = yamls_per_game
+        self.seed = seed
+        self.samples = samples
+        self.player_files = player_files
+        self.gen_seed = gen_seed
+        self.dump = dump
+        self.submitted_at = submitted_at
+        self.slow_after = slow_after
+
+
+META = None
+STATIC_YAMLS = None
+
+
+def load_meta(meta_path):
+    global META
+    if META is None:
+        if meta_path:
+            with open(meta_path, "r", encoding='utf-8-sig') as fd:
+                META = yaml.load(fd.read(), Loader=YAML_LOADER)
+        else:
+            META = {}
+    return META
+
+
+def load_static_yamls(static_dir):
+    global STATIC_YAMLS
+    if STATIC_YAMLS is None:
+        STATIC_YAMLS = []
+        if static_dir:
+            for yaml_file in os.listdir(static_dir):
+                path = os.path.join(static_dir, yaml_file)
+                if not os.path.isfile(path):
+                    continue
+                with open(path, "r", encoding='utf-8-sig') as fd:
+                    yaml_content = fd.read()
+                STATIC_YAMLS.append((yaml_content, load_yaml_all(yaml_content)))
+    return STATIC_YAMLS
+
+
+SAMPLE_INDEX_FILE = ".apfuzz_index.json"
+# Version 1 indexed files that weren't valid UTF-8
+SAMPLE_INDEX_VERSION = 2
+
+
+def decode_sample(raw):
+    # The index and the workers have to agree on which files can be loaded
+    return raw.decode("utf-8-sig")
+
+
+def _index_sample(raw):
+    try:
+        docs = load_yaml_all(decode_sample(raw))
+    except UnicodeDecodeError as e:
+        return [], str(e)
+    except yaml.YAMLError as e:
+        return [], str(e)
+
+    games = []
+    for doc in docs:
+        if not isinstance(doc, dict):
+            continue
+        game = doc.get("game")
+        # Weighted games are a dict of game name to weight
+        if isinstance(game, dict):
+            games.extend(str(name) for name in game)
+        elif game is not None:
+            games.append(str(game))
+
+    if not games:
+        return [], "No document with a game"
+    return games, None
+
+
+def load_sample_index(sample_dir):
+    """
+    Returns the index of a --sample-from corpus as a dict of file name to
+    entry. Entries store the size and mtime of the file, the hash of its
+    content, the games it contains and its parse error if it has one.
+    The index is stored in the corpus directory, only new or modified files
+    are read and parsed again.
+    """
+    index_path = os.path.join(sample_dir, SAMPLE_INDEX_FILE)
+    old_index = {}
+    try:
+        with open(index_path, "r", encoding="utf-8") as fd:
+            stored = json.load(fd)
+        if stored.get("version") == SAMPLE_INDEX_VERSION:
+            old_index = stored["files"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    index = {}
+    changed = False
+    with os.scandir(sample_dir) as entries:
+        for entry in entries:
+            if entry.name.startswith(".") or not entry.is_file():
+                continue
+
+            stat = entry.stat()
+            old = old_index.get(entry.name)
+            if old is not None and old["size"] == stat.st_size and old["mtime_ns"] == stat.st_mtime_ns:
+                index[entry.name] = old
+                continue
+
+            with open(entry.path, "rb") as fd:
+                raw = fd.read()
+            digest = hashlib.sha256(raw).hexdigest()
+            changed = True
+
+            if old is not None and old["sha256"] == digest:
+                games, error = old["games"], old["error"]
+            else:
+                games, error = _index_sample(raw)
+
+            index[entry.name] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": digest,
+                "games": games,
+                "error": error,
+            }
+
+    if changed or len(index) != len(old_index):
+        try:
+            tmp_path = f"{index_path}.{os.getpid()}"
+            with open(tmp_path, "w", encoding="utf-8") as fd:
+                json.dump({"version": SAMPLE_INDEX_VERSION, "files": index}, fd)
+            os.replace(tmp_path, index_path)
+        except OSError as e:
+            print(f"Couldn't save the --sample-from index to {index_path}: {e}")
+
+    return index
+
+
+def load_sample(path):
+    with open(path, "rb") as fd:
+        docs = load_yaml_all(decode_sample(fd.read()))
+    for doc in docs:
+        if isinstance(doc, dict) and 'name' in doc:
+            doc['name'] = 'Player{number}'
+    return docs
+
+
+def roll_player_files(job, args):
+    # Seeding here makes the generation seed reproducible from the descriptor
+    # alone, and the rolled options too with the default --roll-batch 1. With
+    # batches, the options come from this worker's buffer for the world.
+    random.seed(job.seed)
+
+    if job.player_files is not None:
+        return [PlayerFile(name, copy.deepcopy(docs)) for name, docs in job.player_files]
+
+    if job.samples is not None:
+        if args.sample_from is None:
+            raise Exception("The coordinator samples YAMLs from a corpus, pass --sample-from to the agent")
+        # Agents can keep the corpus somewhere else than the coordinator
+        player_files = [
+            PlayerFile(name, load_sample(os.path.join(args.sample_from, sample)))
+            for name, sample in job.samples
+        ]
+    else:
+        meta = load_meta(args.meta)
+        player_files = [
+            PlayerFile(
+                f"{job.i}-{nb}.yaml",
+                [generate_random_options(game, meta, args.roll_batch)],
+                renderer=get_world_sampler(game, meta).render,
+            )
+            for nb, game in enumerate(
+                g for g in job.games for _ in range(job.yamls_per_game)
+            )
+        ]
+
+    for nb, (yaml_content, docs) in enumerate(load_static_yamls(args.with_static_worlds)):
+        player_files.append(PlayerFile(f"static-{job.i}-{nb}.yaml", docs, yaml_content))
+
+    return player_files
+
+
+class Dispatcher:
+    """
+    Bounds the number of runs that are submitted to the pool but not done yet.
+    `submit` blocks without using any CPU until a slot frees up, `done` is
+    called exactly once per run from whatever thread handles its result.
+    The `job` given to `submit` gets the time at which it was handed to the
+    pool, once it got its slot.
+    """
+    def __init__(self, max_in_flight):
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Condition()
+        self._in_flight = 0
+
+    def submit(self, p, func, args, callback, error_callback, affinity=None, job=None):
+        self._slots.acquire()
+        with self._lock:
+            self._in_flight += 1
+        if job is not None:
+            job.submitted_at = time.time()
+        try:
+            # Only AffinityPool knows what to do with the world of a run
+            kwargs = {"affinity": affinity} if affinity is not None else {}
+            return p.apply_async(func, args=args, callback=callback, error_callback=error_callback, **kwargs)
+        except BaseException:
+            self.done()
+            raise
+
+    def done(self):
+        with self._lock:
+            self._in_flight -= 1
+            if self._in_flight == 0:
+                self._lock.notify_all()
+        self._slots.release()
+
+    def wait_idle(self):
+        with self._lock:
+            while self._in_flight > 0:
+                self._lock.wait()
+
+
+# Recycling policy of this worker, see --recycle-rss and --recycle-after
+RECYCLE_RSS = None
+RECYCLE_AFTER = None
+TASKS_DONE = 0
+
+
+def recycle_reason():
+    """Why this worker should exit after the run it just did, None if it shouldn't"""
+    if RECYCLE_AFTER is not None and TASKS_DONE >= RECYCLE_AFTER:
+        return "tasks"
+    if RECYCLE_RSS is not None:
+        try:
+            rss = read_memory_status("VmRSS")
+        except OSError:
+            return None
+        if rss is not None and rss > RECYCLE_RSS:
+            return "rss"
+    return None
+
+
+def finish_task(result):
+    """Counts a run this worker finished, returns why the worker should exit after it, if it should"""
+    global TASKS_DONE
+    TASKS_DONE += 1
+    reason = recycle_reason()
+    if reason is not None and result[0] and isinstance(result[1], RunResult):
+        result[1].recycled = reason
+    return reason
+
+
+def recycling_worker(inqueue, outqueue, initializer, initargs, maxtasks, wrap_exception, slots, state):
+    """
+    multiprocessing.pool.worker, except that the worker waits for a slot, if
+    the pool has slots, once it's initialized and exits cleanly, giving its
+    slot back, when recycle_reason says so. Why it exited goes back with the result of its
+    last run. `state` tells the pool whether the worker holds a slot and
+    which run it's doing, for when it dies without exiting cleanly.
+    """
+    global WORKER_STATE
+    WORKER_STATE = state
+    if hasattr(inqueue, "_writer"):
+        inqueue._writer.close()
+        outqueue._reader.close()
+
+    if initializer is not None:
+        initializer(*initargs)
+    if slots is not None:
+        slots.acquire()
+        state[0] = 1
+
+    while True:
+        try:
+            task = inqueue.get()
+        except (EOFError, OSError):
+            break
+        if task is None:
+            break
+
+        job, i, func, args, kwds = task
+        state[1] = job
+        try:
+            result = (True, func(*args, **kwds))
+        except Exception as e:
+            if wrap_exception:
+                e = multiprocessing.pool.ExceptionWithTraceback(e, e.__traceback__)
+            result = (False, e)
+
+        reason = finish_task(result)
+        try:
+            outqueue.put((job, i, result))
+        except Exception as e:
+            wrapped = multiprocessing.pool.MaybeEncodingError(e, result[1])
+            outqueue.put((job, i, (False, wrapped)))
+        state[1] = -1
+
+        task = job = result = func = args = kwds = None
+        if reason is not None:
+            break
+
+    if slots is not None:
+        state[0] = 0
+        slots.release()
+
+
+class WatchedPool(multiprocessing.pool.Pool):
+    """
+    multiprocessing.pool.Pool replaces the workers that die, but never
+    reports the run they were doing so whoever waits for it waits forever.
+    This pool reports it as failed instead, unless the worker handed it over
+    to TIMEOUT_QUEUE before exiting.
+    """
+    def __init__(self, processes, initializer=None, initargs=()):
+        self._workers = []
+        super().__init__(processes, initializer, initargs)
+
+    def Process(self, ctx, **kwds):
+        # Only called to start the pool or to replace workers that exited
+        for worker, state in self._workers[:]:
+            if worker.exitcode is not None:
+                if worker.exitcode != 0:
+                    self._worker_died(worker, state)
+                self._workers.remove((worker, state))
+
+        state = ctx.RawArray("q", [0, -1])
+        kwds["target"] = recycling_worker
+        kwds["args"] = (*kwds["args"], self._worker_slots(), state)
+        worker = ctx.Process(**kwds)
+        self._workers.append((worker, state))
+        return worker
+
+    def _worker_slots(self):
+        return None
+
+    def _worker_died(self, worker, state):
+        result = self._cache.get(state[1])
+        if result is not None:
+            try:
+                result._set(0, (False, Exception(f"Worker died with exit code {worker.exitcode}")))
+            except KeyError:
+                # The result handler got the run's result in the meantime
+                pass
+
+
+class RecyclingPool(WatchedPool):
+    """
+    A pool whose workers exit after a number of runs or past some RSS. It
+    keeps one spare worker, initialized but waiting for a slot, so that a
+    worker that exits (or gets killed on a timeout) is replaced right away
+    rather than after a fork. Workers that didn't exit cleanly can't give
+    their slot back, the pool does it for them when it replaces them.
+    """
+    def __init__(self, processes, initializer=None, initargs=()):
+        self._slots = multiprocessing.Semaphore(processes)
+        super().__init__(processes + 1, initializer, initargs)
+
+    def _worker_slots(self):
+        return self._slots
+
+    def _worker_died(self, worker, state):
+        # The spare never got a slot
+        if state[0]:
+            self._slots.release()
+        super()._worker_died(worker, state)
+
+
+def affinity_worker(worker_id, tasks, results, initializer, initargs):
+    """Worker loop of AffinityPool, runs come one by one on the worker's own pipe"""
+    global AFFINITY_WORKER
+    AFFINITY_WORKER = (worker_id, results)
+    initializer(*initargs)
+    while True:
+        try:
+            task = tasks.recv()
+        except (EOFError, OSError):
+            break
+        if task is None:
+            break
+
+        func, args = task
+        try:
+            result = (True, func(*args))
+        except Exception as e:
+            result = (False, multiprocessing.pool.ExceptionWithTraceback(e, e.__traceback__))
+
+        reason = finish_task(result)
+        try:
+            results.put(("result", worker_id, result, reason is not None))
+        except Exception as e:
+            results.put(("result", worker_id, (False, multiprocessing.pool.MaybeEncodingError(e, result[1])), reason is not None))
+
+        task = func = args = result = None
+        if reason is not None:
+            break
+
+
+# How long a run can wait for a worker that ran its world before any worker takes it
+AFFINITY_MAX_WAIT = 10
+
+
+class AffinityPool:
+    """
+    A pool that sends the runs of a world to workers that ran that world
+    recently, so that every worker doesn't end up loading and warming up the
+    code and caches of every world. Runs wait in a queue per world. An idle
+    worker takes the next run of the most recent world it ran that has one,
+    steals from the longest queue when none of them do, and takes the oldest
+    run first once it waited for AFFINITY_MAX_WAIT seconds. Only a run at a
+    time is sent to a worker. Like RecyclingPool, it keeps a spare worker and
+    workers exit according to the recycling policy.
+    """
+    def __init__(self, processes, initializer=None, initargs=()):
+        self._ctx = multiprocessing.get_context()
+        self._processes = processes
+        self._initializer = initializer
+        self._initargs = initargs
+        self._results = self._ctx.SimpleQueue()
+        self._lock = threading.Lock()
+        # worker id -> (process, pipe to send it runs)
+        self._workers = {}
+        self._idle = []
+        # worker id -> the run it's doing
+        self._running = {}
+        # worker id -> worlds it ran, the most recent one last
+        self._recent = {}
+        # world -> runs waiting, as (func, args, callback, error_callback, world, submitted_at)
+        self._pending = defaultdict(deque)
+        self._next_worker_id = 0
+        self._closed = False
+
+        with self._lock:
+            for _ in range(processes + 1):
+                self._start_worker()
+        self._result_handler = threading.Thread(target=self._handle_results, daemon=True)
+        self._result_handler.start()
+        self._worker_handler = threading.Thread(target=self._handle_workers, daemon=True)
+        self._worker_handler.start()
+
+    def _start_worker(self):
+        worker_id = self._next_worker_id
+        self._next_worker_id += 1
+        reader, writer = self._ctx.Pipe(duplex=False)
+        process = self._ctx.Process(
+            target=affinity_worker,
+            args=(worker_id, reader, self._results, self._initializer, self._initargs),
+            daemon=True,
+        )
+        process.start()
+        reader.close()
+        self._workers[worker_id] = (process, writer)
+        self._recent[worker_id] = []
+        self._idle.append(worker_id)
+
+    def apply_async(self, func, args=(), callback=None, error_callback=None, affinity=None):
+        with self._lock:
+            self._pending[affinity].append((func, args, callback, error_callback, affinity, time.monotonic()))
+            sends = self._schedule()
+        self._send(sends)
+
+    def _pick(self, worker_id, steal):
+        queues = [queue for queue in self._pending.values() if queue]
+        if not queues:
+            return None
+        oldest = min(queues, key=lambda queue: queue[0][5])
+        if time.monotonic() - oldest[0][5] > AFFINITY_MAX_WAIT:
+            return oldest.popleft()
+        if not steal:
+            for world in reversed(self._recent[worker_id]):
+                if self._pending[world]:
+                    return self._pending[world].popleft()
+            return None
+        return max(queues, key=len).popleft()
+
+    def _schedule(self):
+        """Hands waiting runs to idle workers, returns what to send to whom. Called with the lock held."""
+        sends = []
+        # Idle workers that ran the world of a waiting run get it before anyone can steal it
+        for steal in (False, True):
+            for worker_id in self._idle[:]:
+                if len(self._running) >= self._processes:
+                    return sends
+                task = self._pick(worker_id, steal)
+                if task is None:
+                    continue
+                self._idle.remove(worker_id)
+                self._running[worker_id] = task
+                recent = self._recent[worker_id]
+                if task[4] in recent:
+                    recent.remove(task[4])
+                recent.append(task[4])
+                sends.append((worker_id, task))
+        return sends
+
+    def _send(self, sends):
+        while sends:
+            retry = []
+            for worker_id, task in sends:
+                try:
+                    self._workers[worker_id][1].send((task[0], task[1]))
+                except (KeyError, OSError):
+                    # The worker died in the meantime, the worker handler replaces it
+                    with self._lock:
+                        self._running.pop(worker_id, None)
+                        self._pending[task[4]].appendleft(task)
+                        retry.extend(self._schedule())
+            sends = retry
+
+    def _handle_results(self):
+        while True:
+            message = self._results.get()
+            if message is None:
+                break
+            kind, worker_id = message[:2]
+            with self._lock:
+                task = self._running.pop(worker_id, None)
+                if kind == "result" and not message[3] and worker_id in self._workers:
+                    self._idle.append(worker_id)
+                sends = self._schedule()
+            self._send(sends)
+
+            # The kill path of a timeout handed the run over to TIMEOUT_QUEUE
+            if task is None or kind == "handed_over":
+                continue
+            if kind == "result":
+                success, value = message[2]
+            else:
+                success, value = False, Exception(f"Worker died with exit code {message[2]}")
+            callback = task[2] if success else task[3]
+            if callback is not None:
+                callback(value)
+
+    def _handle_workers(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+                sentinels = {process.sentinel: worker_id for worker_id, (process, _) in self._workers.items()}
+            ready = multiprocessing.connection.wait(list(sentinels), timeout=0.1)
+
+            died = []
+            with self._lock:
+                if self._closed:
+                    return
+                for sentinel in ready:
+                    worker_id = sentinels[sentinel]
+                    process, pipe = self._workers.pop(worker_id)
+                    process.join()
+                    pipe.close()
+                    self._recent.pop(worker_id, None)
+                    if worker_id in self._idle:
+                        self._idle.remove(worker_id)
+                    if worker_id in self._running:
+                        died.append((worker_id, process.exitcode))
+                while len(self._workers) < self._processes + 1:
+                    self._start_worker()
+                sends = self._schedule()
+            self._send(sends)
+
+            # Whatever the worker sent before dying is already in the queue, so
+            # the result handler only reports the run as lost if nothing claimed it
+            for worker_id, exitcode in died:
+                self._results.put(("died", worker_id, exitcode))
+
+    def terminate(self):
+        with self._lock:
+            self._closed = True
+            workers = list(self._workers.values())
+        for process, _ in workers:
+            process.terminate()
+        for process, pipe in workers:
+            process.join()
+            pipe.close()
+        self._results.put(None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.terminate()
+
+
+def load_failure_dir(failure_dir):
+    """
+    Returns the `(filename, docs)` pairs of the player files dumped in a
+    failure directory and the generation seed if it was recorded.
+    """
+    player_files = []
+    for name in sorted(os.listdir(failure_dir)):
+        if not name.endswith((".yaml", ".yml")):
+            continue
+        with open(os.path.join(failure_dir, name), "r", encoding="utf-8-sig") as fd:
+            player_files.append((name, load_yaml_all(fd.read())))
+
+    seed = None
+    seed_path = os.path.join(failure_dir, "seed.txt")
+    if os.path.exists(seed_path):
+        with open(seed_path, "r", encoding="utf-8") as fd:
+            seed = int(fd.read().strip())
+
+    return player_files, seed
+
+
+def _option_sections(doc):
+    """Yields the option sections of a player document, one per game it can roll"""
+    game = doc.get("game")
+    games = game if isinstance(game, dict) else [game]
+    for game_name in games:
+        if isinstance(doc.get(game_name), dict):
+            yield game_name
+
+
+def ddmin(items, test):
+    """
+    Delta debugging: returns a 1-minimal subset of `items` that still passes
+    `test`. `test` gets a list of candidate subsets and returns whether each
+    one of them passes, which lets it evaluate them concurrently.
+    """
+    n = 2
+    while len(items) >= 2:
+        size = len(items) / n
+        chunks = [items[int(k * size):int((k + 1) * size)] for k in range(n)]
+        complements = [items[:int(k * size)] + items[int((k + 1) * size):] for k in range(n)]
+        # With 2 chunks, the complements are the chunks themselves
+        candidates = chunks if n == 2 else chunks + complements
+        results = test(candidates)
+
+        if any(results[:n]):
+            items = chunks[results.index(True)]
+            n = 2
+        elif any(results[n:]):
+            items = complements[results.index(True, n) - n]
+            n = max(n - 1, 2)
+        elif n >= len(items):
+            break
+        else:
+            n = min(len(items), n * 2)
+
+    return items
+
+
+class Minimizer:
+    """
+    Reduces the player files of a failure to the players and options needed
+    to reproduce it. Every test of `ddmin` runs its candidates concurrently on
+    the pool through `gen_wrapper`, like normal runs.
+    """
+    def __init__(self, p, args, tmp, player_files, gen_seed, target):
+        self.p = p
+        self.args = args
+        self.tmp = tmp
+        self.player_files = player_files
+        self.gen_seed = gen_seed
+        self.target = target
+        self.generations = 0
+        self._results = {}
+        self._lock = threading.Condition()
+        self._next_i = 0
+
+    def _store(self, i, result):
+        with self._lock:
+            self._results[i] = result
+            self._lock.notify_all()
+
+    def timed_out(self, i):
+        self._store(i, RunResult(GenOutcome.Timeout, killed=True))
+
+    def run(self, candidates):
+        """Runs every candidate (a list of player files) and returns their `RunResult`"""
+        indices = []
+        for player_files in candidates:
+            i = self._next_i
+            self._next_i += 1
+            indices.append(i)
+
+            job = RunDescriptor(i, [], 0, 0, player_files=player_files, gen_seed=self.gen_seed, dump=False)
+            yamls_dir = os.path.join(self.tmp, f"apfuzz-minimize-{i}")
+            self.p.apply_async(
+                gen_wrapper,
+                args=(yamls_dir, job, "minimize", self.args, self.tmp),
+                callback=functools.partial(self._done, yamls_dir, i),
+                error_callback=functools.partial(self._failed, yamls_dir, i),
+            )
+
+        with self._lock:
+            while any(i not in self._results for i in indices):
+                self._lock.wait()
+            self.generations += len(indices)
+            return [self._results.pop(i) for i in indices]
+
+    def _done(self, yamls_dir, i, result):
+        shutil.rmtree(yamls_dir, ignore_errors=True)
+        self._store(i, result)
+
+    def _failed(self, yamls_dir, i, raised):
+        shutil.rmtree(yamls_dir, ignore_errors=True)
+        self._store(i, RunResult(GenOutcome.Failure))
+
+    def matches(self, result):
+        outcome, signature = result.outcome, result.signature
+        if outcome != self.target[0]:
+            return False
+        # Where a generation gets interrupted isn't stable, any timeout will do
+        if outcome == GenOutcome.Timeout:
+            return True
+        return signature is not None and signature.digest == self.target[1]
+
+    def minimize_players(self):
+        def test(candidates):
+            results = self.run([[self.player_files[k] for k in candidate] for candidate in candidates])
+            return [self.matches(result) for result in results]
+
+        kept = ddmin(list(range(len(self.player_files))), test)
+        self.player_files = [self.player_files[k] for k in kept]
+
+    def _with_options(self, kept):
+        kept = set(kept)
+        player_files = []
+        for file_nb, (name, docs) in enumerate(self.player_files):
+            docs = copy.deepcopy(docs)
+            for doc_nb, doc in enumerate(docs):
+                if not isinstance(doc, dict):
+                    continue
+                for game_name in _option_sections(doc):
+                    doc[game_name] = {
+                        key: value for key, value in doc[game_name].items()
+                        if (file_nb, doc_nb, game_name, key) in kept
+                    }
+            player_files.append((name, docs))
+        return player_files
+
+    def minimize_options(self):
+        # Options left out of a YAML are rolled from their default
+        options = [
+            (file_nb, doc_nb, game_name, key)
+            for file_nb, (_, docs) in enumerate(self.player_files)
+            for doc_nb, doc in enumerate(docs) if isinstance(doc, dict)
+            for game_name in _option_sections(doc)
+            for key in doc[game_name]
+        ]
+
+        def test(candidates):
+            results = self.run([self._with_options(candidate) for candidate in candidates])
+            return [self.matches(result) for result in results]
+
+        if test([[]])[0]:
+            kept = []
+        else:
+            kept = ddmin(options, test)
+        self.player_files = self._with_options(kept)
+        return len(options), len(kept)
+
+
+def parse_duration(duration):
+    """Parses a number of seconds, optionally suffixed with s, m or h"""
+    units = {"s": 1, "m": 60, "h": 3600}
+    if duration and duration[-1] in units:
+        return float(duration[:-1]) * units[duration[-1]]
+    return float(duration)
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+# Coordinator and agents talk with JSON messages prefixed by their length
+def send_message(sock, message):
+    data = json.dumps(message).encode("utf-8")
+    sock.sendall(struct.pack(">I", len(data)) + data)
+
+
+def recv_message(sock_file):
+    header = sock_file.read(4)
+    if len(header) < 4:
+        return None
+    (length,) = struct.unpack(">I", header)
+    data = sock_file.read(length)
+    if len(data) < length:
+        return None
+    return json.loads(data)
+
+
+# Settings agents get from the coordinator. Everything else, paths included,
+# comes from the agent's own command line.
+AGENT_SETTINGS = ["runs", "timeout", "timeout_grace", "dump_ignored", "skip_output", "keep_reproducers", "roll_batch", "sample_profile", "slow_factor", "memory_limit", "tracemalloc"]
+
+
+class Coordinator:
+    """
+    Hands out the runs of a campaign to agents and merges the results they
+    send back into this process' report. Runs given to an agent that
+    disconnects before finishing them are handed out again.
+    """
+    def __init__(self, args, jobs):
+        self.args = args
+        self._jobs = jobs
+        self._requeued = []
+        self._outstanding = {}
+        self._exhausted = False
+        self._kept = defaultdict(int)
+        self._lock = threading.Condition()
+
+    def _next_runs(self, count):
+        with self._lock:
+            runs = []
+            while len(runs) < count:
+                if self._requeued:
+                    runs.append(self._requeued.pop())
+                    continue
+                if self._exhausted:
+                    break
+                try:
+                    runs.append(next(self._jobs))
+                except StopIteration:
+                    self._exhausted = True
+            for job, apworld_name in runs:
+                job.slow_after = slow_threshold(apworld_name, self.args)
+                self._outstanding[job.i] = (job, apworld_name)
+                if CHECKPOINT is not None:
+                    CHECKPOINT.started(job, apworld_name)
+            return runs
+
+    def finished(self):
+        with self._lock:
+            return self._exhausted and not self._requeued and not self._outstanding
+
+    def _record(self, msg):
+        apworld_name, i = msg["apworld"], msg["i"]
+        result = RunResult(**msg["result"])
+        if result.signature is not None:
+            result.signature = FailureSignature(**result.signature)
+        signature = result.signature
+        files = msg["files"]
+        with self._lock:
+            if self._outstanding.pop(i, None) is None:
+                # Already handed out again and recorded from another agent
+                return
+            # Every agent keeps its own reproducers, only keep enough overall
+            keep = self.args.keep_reproducers
+            if files and keep > 0 and self._kept[signature.digest] >= keep:
+                files = {}
+                signature.reproducer = False
+            elif files:
+                self._kept[signature.digest] += 1
+            self._lock.notify_all()
+
+        if files:
+            output_dir = generation_output_dir(result.outcome, apworld_name, i)
+            os.makedirs(output_dir, exist_ok=True)
+            for name, data in files.items():
+                with open(os.path.join(output_dir, os.path.basename(name)), "wb") as fd:
+                    fd.write(base64.b64decode(data))
+        record_outcome(apworld_name, i, self.args, result)
+
+    def handle_agent(self, sock):
+        assigned = set()
+        sock_file = sock.makefile("rb")
+        try:
+            hello = recv_message(sock_file)
+            if hello is None or hello.get("type") != "hello":
+                return
+            send_message(sock, {
+                "type": "config",
+                "settings": {key: getattr(self.args, key) for key in AGENT_SETTINGS},
+            })
+
+            while True:
+                msg = recv_message(sock_file)
+                if msg is None or msg["type"] == "bye":
+                    break
+
+                if msg["type"] == "request":
+                    runs = self._next_runs(msg["count"])
+                    assigned.update(job.i for job, _ in runs)
+                    if runs:
+                        send_message(sock, {
+                            "type": "runs",
+                            "runs": [{"apworld": apworld_name, "job": vars(job)} for job, apworld_name in runs],
+                        })
+                    elif self.finished():
+                        send_message(sock, {"type": "done"})
+                    else:
+                        # Other agents might still disconnect and leave runs behind
+                        send_message(sock, {"type": "wait"})
+                elif msg["type"] == "result":
+                    assigned.discard(msg["i"])
+                    self._record(msg)
+        except (OSError, ValueError) as e:
+            print(f"Lost connection to an agent: {e}")
+        finally:
+            with self._lock:
+                for i in assigned:
+                    if i in self._outstanding:
+                        self._requeued.append(self._outstanding.pop(i))
+                self._lock.notify_all()
+            sock.close()
+
+
+class AgentConnection:
+    """
+    The connection from an agent to its coordinator. Runs are requested from
+    the thread dispatching them, results are sent from the result handlers.
+    """
+    def __init__(self, sock):
+        self._sock = sock
+        self._file = sock.makefile("rb")
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        with self._lock:
+            send_message(self._sock, message)
+
+    def recv(self):
+        return recv_message(self._file)
+
+    def jobs(self, batch_size):
+        while True:
+            self.send({"type": "request", "count": batch_size})
+            msg = self.recv()
+            if msg is None or msg["type"] == "done":
+                return
+            if msg["type"] == "wait":
+                time.sleep(1)
+                continue
+            for run in msg["runs"]:
+                yield RunDescriptor(**run["job"]), run["apworld"]
+
+    def send_result(self, apworld_name, i, result):
+        # Whatever got dumped is sent along with the result and removed here
+        output_dir = generation_output_dir(result.outcome, apworld_name, i)
+        files = {}
+        if os.path.isdir(output_dir):
+            for name in os.listdir(output_dir):
+                with open(os.path.join(output_dir, name), "rb") as fd:
+                    files[name] = base64.b64encode(fd.read()).decode("ascii")
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+        self.send({
+            "type": "result",
+            "apworld": apworld_name,
+            "i": i,
+            "result": dict(vars(result), signature=vars(result.signature) if result.signature else None),
+            "files": files,
+        })
 
 
 IS_TTY = sys.stdout.isatty()
@@ -754,31 +2832,450 @@ SUCCESS = 0
 FAILURE = 0
 TIMEOUTS = 0
 OPTION_ERRORS = 0
-SUBMITTED = 0
-REPORT = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: [])))
+SLOW = 0
+OUT_OF_MEMORY = 0
+TIMEOUT_KILLS = 0
+# Workers recycled during this session by reason
+RECYCLES = Counter()
+# Runs that were the first of their world in their worker
+FIRST_RUNS = 0
+# PSS of every worker once all the runs were done, in bytes
+WORKER_PSS = []
+# How long it took to load the worlds and the main process' RSS once it's done
+STARTUP_STATS = None
+RESUMED_RUNS = 0
+# Phase timings of this session over every world, the per world ones are in the report
+PHASE_TIMINGS = defaultdict(lambda: Histogram())
+# Same for the generation stages, by game and stage
+STAGE_TIMINGS = defaultdict(lambda: Histogram())
+# How many of them the status at the end prints, report.json has all of them
+STAGES_SHOWN = 20
+# Profile samples by world and collapsed stack, see --sample-profile
+PROFILES = defaultdict(Counter)
+# Durations of the successful generations of every world, to tell which ones are slow
+WORLD_LATENCY = defaultdict(lambda: Histogram())
+# How many generations of a world have to succeed before any can be slow
+SLOW_MIN_RUNS = 20
+DISPATCHER = None
+RESULTS_LOG = None
+RESULTS_FILE = "results.jsonl"
+# How often the results log is synced to disk, in seconds
+RESULTS_SYNC_INTERVAL = 5
+OUTCOME_NAMES = {
+    GenOutcome.Success: "success",
+    GenOutcome.Failure: "failure",
+    GenOutcome.Timeout: "timeout",
+    GenOutcome.OptionError: "ignored",
+    GenOutcome.Slow: "slow",
+    GenOutcome.OutOfMemory: "oom",
+}
+
+
+def read_results(path):
+    with open(path, "r", encoding="utf-8") as fd:
+        for line in fd:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # The last line might be incomplete if the fuzzer got killed
+                continue
 
 
-def gen_callback(yamls_dir, apworld_name, i, args, outcome):
+class ResultsLog:
+    """
+    The results stream of a campaign, with one JSON record per line for every
+    run as it finishes. The details of a failure signature are written in
+    their own record the first time the signature shows up. Writes are
+    buffered and synced to disk every RESULTS_SYNC_INTERVAL seconds.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.seen_signatures = set()
+        if os.path.exists(path):
+            for record in read_results(path):
+                if "i" not in record:
+                    self.seen_signatures.add(record["signature"])
+        self._fd = open(path, "a", encoding="utf-8", buffering=1 << 16)
+        self._last_sync = time.monotonic()
+
+    def _write(self, record):
+        self._fd.write(json.dumps(record, separators=(",", ":")))
+        self._fd.write("\n")
+
+    def write_result(self, apworld_name, i, result):
+        if self._fd.closed:
+            return
+
+        signature = result.signature
+        if signature is not None and signature.digest not in self.seen_signatures:
+            self.seen_signatures.add(signature.digest)
+            self._write({
+                "signature": signature.digest,
+                "type": signature.exc_type,
+                "message": signature.message,
+                "frames": signature.frames,
+            })
+
+        record = {"i": i, "world": apworld_name, "outcome": OUTCOME_NAMES[result.outcome]}
+        if result.games:
+            record["games"] = result.games
+        if signature is not None:
+            record["signature"] = signature.digest
+            record["reproducer"] = signature.reproducer
+        if result.duration is not None:
+            record["duration"] = round(result.duration, 3)
+        if result.seed is not None:
+            record["seed"] = result.seed
+        if result.killed:
+            record["killed"] = True
+        if result.peak_rss is not None:
+            record["peak_rss"] = result.peak_rss
+        if result.traced_peak is not None:
+            record["traced_peak"] = result.traced_peak
+        if result.recycled is not None:
+            record["recycled"] = result.recycled
+        if result.first_run:
+            record["first_run"] = True
+        if result.phases:
+            record["phases"] = {name: round(duration, 6) for name, duration in result.phases.items()}
+        if result.stages:
+            record["stages"] = {
+                game: {stage: round(duration, 6) for stage, duration in game_stages.items()}
+                for game, game_stages in result.stages.items()
+            }
+        self._write(record)
+
+        if time.monotonic() - self._last_sync >= RESULTS_SYNC_INTERVAL:
+            self.sync()
+
+    def sync(self):
+        """Syncs the stream to disk and returns its size"""
+        if not self._fd.closed:
+            self._fd.flush()
+            os.fsync(self._fd.fileno())
+            self._last_sync = time.monotonic()
+        return os.path.getsize(self.path)
+
+    def close(self):
+        if not self._fd.closed:
+            self.sync()
+            self._fd.close()
+
+
+class Histogram:
+    """
+    Histogram of durations in logarithmic buckets, each bucket being 10%
+    wider than the previous one. Percentiles are the upper bound of their bucket.
+    """
+    BASE = 1.1
+    MIN = 1e-6
+
+    def __init__(self):
+        self.buckets = defaultdict(int)
+        self.count = 0
+        self.total = 0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.buckets[int(math.log(max(value, self.MIN) / self.MIN, self.BASE))] += 1
+
+    def percentile(self, p):
+        rank = self.count * p / 100
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return self.MIN * self.BASE ** (bucket + 1)
+        return 0
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 6) if self.count else 0,
+            "p50": round(self.percentile(50), 6),
+            "p95": round(self.percentile(95), 6),
+            "p99": round(self.percentile(99), 6),
+        }
+
+
+# Peak RSS of the generations of this session in MiB, the per world ones are in the report
+PEAK_RSS = Histogram()
+
+# Order in which phases are printed, they happen roughly in that order
+PHASES = ["queue_wait", "roll", "yaml_dump", "write", "hooks", "gen_main", "er_main", "classify", "dump", "cleanup"]
+
+
+def fold_results(path):
+    """
+    Folds a results stream into the stats of the campaign, a report of its
+    failures, timeouts, slow runs and runs out of memory by world and
+    signature, the histograms of the duration of every phase by world and of
+    every stage by world and game, the histograms of the peak memory (in
+    MiB) of the generations by world, and how many workers were recycled
+    after a run of each world, by reason.
+    """
+    stats = {"total": 0, "success": 0, "failure": 0, "timeout": 0, "ignored": 0, "slow": 0, "oom": 0, "timeout_killed": 0, "recycled": 0, "first_runs": 0}
+    signatures = {}
+    report = defaultdict(dict)
+    timings = defaultdict(lambda: defaultdict(Histogram))
+    stages = defaultdict(lambda: defaultdict(lambda: defaultdict(Histogram)))
+    memory = defaultdict(lambda: defaultdict(Histogram))
+    recycles = defaultdict(Counter)
+    if not os.path.exists(path):
+        return stats, report, timings, stages, memory, recycles
+
+    for record in read_results(path):
+        if "i" not in record:
+            signatures[record["signature"]] = record
+            continue
+
+        stats["total"] += 1
+        stats[record["outcome"]] += 1
+        if record.get("killed"):
+            stats["timeout_killed"] += 1
+        if "recycled" in record:
+            stats["recycled"] += 1
+            recycles[record["world"]][record["recycled"]] += 1
+        if record.get("first_run"):
+            stats["first_runs"] += 1
+        for name, duration in record.get("phases", {}).items():
+            timings[record["world"]][name].add(duration)
+        if "duration" in record:
+            timings[record["world"]]["total"].add(record["duration"])
+        for game, game_stages in record.get("stages", {}).items():
+            for stage, duration in game_stages.items():
+                stages[record["world"]][game][stage].add(duration)
+        for field in ("peak_rss", "traced_peak"):
+            if field in record:
+                memory[record["world"]][field].add(record[field] / (1024 * 1024))
+        if record["outcome"] not in ("failure", "timeout", "slow", "oom"):
+            continue
+
+        digest = record["signature"]
+        entry = report[record["world"]].get(digest)
+        if entry is None:
+            details = signatures.get(digest, {})
+            entry = report[record["world"]][digest] = {
+                "outcome": record["outcome"],
+                "type": details.get("type", ""),
+                "message": details.get("message", ""),
+                "frames": details.get("frames", []),
+                "count": 0,
+                "reproducers": [],
+            }
+        entry["count"] += 1
+        if record.get("reproducer"):
+            entry["reproducers"].append(record["i"])
+
+    return stats, report, timings, stages, memory, recycles
+
+
+def set_results_log(results_log):
+    global RESULTS_LOG
+    RESULTS_LOG = results_log
+
+
+RECORD_LOCK = threading.RLock()
+CHECKPOINT = None
+CHECKPOINT_FILE = "checkpoint.json"
+# Arguments that define a campaign, --resume takes them from the checkpoint
+CAMPAIGN_SETTINGS = [
+    "game", "runs", "duration", "yamls_per_run", "timeout", "timeout_grace", "meta", "dump_ignored", "with_static_worlds",
+    "sample_from", "skip_output", "keep_reproducers", "roll_batch", "hook", "coordinator", "sample_profile",
+    "slow_factor", "memory_limit", "tracemalloc",
+]
+
+
+class Checkpoint:
+    """
+    Progress of a campaign, saved every `interval` seconds and when the
+    fuzzer stops so that --resume can pick it up. Runs that were started but
+    didn't finish by the time of the checkpoint are run again on resume.
+    """
+    def __init__(self, path, interval, settings):
+        self.path = path
+        self.interval = interval
+        self.settings = settings
+        self.next_i = 0
+        self.rng_state = random.getstate()
+        self.in_flight = {}
+        self._last_save = time.monotonic()
+
+    def started(self, job, apworld_name):
+        # Runs are planned from this thread, so the RNG state is the one to
+        # restore to plan the next run
+        with RECORD_LOCK:
+            self.in_flight[job.i] = (job, apworld_name)
+            self.next_i = max(self.next_i, job.i + 1)
+            self.rng_state = random.getstate()
+
+    def finished(self, i):
+        with RECORD_LOCK:
+            self.in_flight.pop(i, None)
+
+    def maybe_save(self):
+        if time.monotonic() - self._last_save >= self.interval:
+            self.save()
+
+    def save(self):
+        with RECORD_LOCK:
+            data = json.dumps({
+                "version": 1,
+                "settings": self.settings,
+                "next_i": self.next_i,
+                "rng_state": self.rng_state,
+                # The results written after this point are dropped on resume
+                "results_offset": RESULTS_LOG.sync() if RESULTS_LOG is not None else 0,
+                "in_flight": [
+                    {"apworld": apworld_name, "job": vars(job)}
+                    for job, apworld_name in sorted(self.in_flight.values(), key=lambda run: run[0].i)
+                ],
+            })
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fd:
+            fd.write(data)
+            fd.flush()
+            os.fsync(fd.fileno())
+        os.replace(tmp_path, self.path)
+        self._last_save = time.monotonic()
+
+    def restore(self, state):
+        """
+        Restores the results stream, the counters and the RNG state from a
+        saved checkpoint. Returns the index of the next run to plan and the
+        runs that have to be run again.
+        """
+        global SUCCESS, FAILURE, TIMEOUTS, OPTION_ERRORS, SLOW, OUT_OF_MEMORY, TIMEOUT_KILLS, RESUMED_RUNS
+
+        results_path = os.path.join(OUT_DIR, RESULTS_FILE)
+        if os.path.exists(results_path):
+            with open(results_path, "r+b") as fd:
+                fd.truncate(state["results_offset"])
+        stats, _, _, _, _, _ = fold_results(results_path)
+        SUCCESS = stats["success"]
+        FAILURE = stats["failure"]
+        TIMEOUTS = stats["timeout"]
+        OPTION_ERRORS = stats["ignored"]
+        SLOW = stats["slow"]
+        OUT_OF_MEMORY = stats["oom"]
+        TIMEOUT_KILLS = stats["timeout_killed"]
+        RESUMED_RUNS = stats["total"]
+
+        version, internal_state, gauss_next = state["rng_state"]
+        random.setstate((version, tuple(internal_state), gauss_next))
+        self.rng_state = random.getstate()
+        self.next_i = state["next_i"]
+        pending = [(RunDescriptor(**run["job"]), run["apworld"]) for run in state["in_flight"]]
+        return self.next_i, pending
+
+
+def set_checkpoint(checkpoint):
+    global CHECKPOINT
+    CHECKPOINT = checkpoint
+
+
+def read_checkpoint(path):
+    with open(path, "r", encoding="utf-8") as fd:
+        state = json.load(fd)
+    if state.get("version") != 1:
+        raise ValueError(f"Unsupported checkpoint version in {path}")
+    return state
+
+
+# Called with every result once it's been recorded, used by agents to send
+# their results to the coordinator
+RESULT_SINK = None
+
+
+def gen_callback(yamls_dir, apworld_name, i, args, result):
     try:
-        if isinstance(outcome, tuple):
-            outcome, exc = outcome
-        else:
-            exc = None
+        if not isinstance(result, RunResult):
+            result = RunResult(result)
+        if result.signature is None and result.outcome != GenOutcome.Success:
+            # The main process dumped this run itself, it wasn't fingerprinted
+            kind = "TimeoutError" if result.outcome == GenOutcome.Timeout else "FuzzerException"
+            result.signature = FailureSignature(f"{result.outcome}-unfingerprinted", kind, "", [])
+
+        cleanup_start = time.perf_counter()
+        try:
+            # Technically not useful but this will prevent me from removing things I don't want when I inevitably mix up the args somewhere...
+            if 'apfuzz' in yamls_dir:
+                shutil.rmtree(yamls_dir)
+        except: # noqa: E722
+            pass
+        if result.phases is not None:
+            result.phases["cleanup"] = time.perf_counter() - cleanup_start
 
-        global SUCCESS, FAILURE, SUBMITTED, OPTION_ERRORS, TIMEOUTS
-        SUBMITTED -= 1
+        record_outcome(apworld_name, i, args, result)
+        if RESULT_SINK is not None:
+            RESULT_SINK(apworld_name, i, result)
+    except Exception as e:
+        print("Error while handling fuzzing result:")
+        traceback.print_exception(e)
+        print("This is most likely a fuzzer bug and should be reported")
+    finally:
+        DISPATCHER.done()
+
+
+def slow_threshold(apworld_name, args):
+    """How long a generation of this world can take before it's slow, None until enough of them succeeded"""
+    if not args.slow_factor:
+        return None
+    with RECORD_LOCK:
+        histogram = WORLD_LATENCY.get(apworld_name)
+        if histogram is None or histogram.count < SLOW_MIN_RUNS:
+            return None
+        return histogram.percentile(50) * args.slow_factor
+
+
+def record_outcome(apworld_name, i, args, result):
+    global SUCCESS, FAILURE, OPTION_ERRORS, SLOW, OUT_OF_MEMORY, TIMEOUTS, TIMEOUT_KILLS, FIRST_RUNS
+
+    outcome = result.outcome
+    with RECORD_LOCK:
+        if CHECKPOINT is not None:
+            CHECKPOINT.finished(i)
+        if RESULTS_LOG is not None:
+            RESULTS_LOG.write_result(apworld_name, i, result)
+        if result.killed:
+            TIMEOUT_KILLS += 1
+        if result.recycled is not None:
+            RECYCLES[result.recycled] += 1
+        if result.first_run:
+            FIRST_RUNS += 1
+        if result.phases:
+            for name, duration in result.phases.items():
+                PHASE_TIMINGS[name].add(duration)
+        if result.stages:
+            for game, game_stages in result.stages.items():
+                for stage, duration in game_stages.items():
+                    STAGE_TIMINGS[(game, stage)].add(duration)
+        if result.profile:
+            PROFILES[apworld_name].update(result.profile)
+        if outcome in (GenOutcome.Success, GenOutcome.Slow) and result.duration is not None:
+            WORLD_LATENCY[apworld_name].add(result.duration)
+        if result.peak_rss is not None:
+            PEAK_RSS.add(result.peak_rss / (1024 * 1024))
 
         if outcome == GenOutcome.Success:
             SUCCESS += 1
             if IS_TTY:
                 print(".", end="")
+        elif outcome == GenOutcome.Slow:
+            SLOW += 1
+            if IS_TTY:
+                print("S", end="")
+        elif outcome == GenOutcome.OutOfMemory:
+            OUT_OF_MEMORY += 1
+            if IS_TTY:
+                print("M", end="")
         elif outcome == GenOutcome.Failure:
-            REPORT[apworld_name][type(exc)][str(exc)].append(i)
             FAILURE += 1
             if IS_TTY:
                 print("F", end="")
         elif outcome == GenOutcome.Timeout:
-            REPORT[apworld_name][TimeoutError][""].append(i)
             TIMEOUTS += 1
             if IS_TTY:
                 print("T", end="")
@@ -789,22 +3286,14 @@ def gen_callback(yamls_dir, apworld_name, i, args, outcome):
 
         # If we're not on a TTY, print progress every once in a while
         if not IS_TTY:
-            checks_done = SUCCESS + FAILURE + TIMEOUTS + OPTION_ERRORS
-            step = args.runs // 50
+            checks_done = SUCCESS + FAILURE + TIMEOUTS + OPTION_ERRORS + SLOW + OUT_OF_MEMORY
+            # Without a number of runs (--duration), we don't know the total
+            step = args.runs // 50 if args.runs is not None else 50
+            total = f" / {args.runs}" if args.runs is not None else ""
             if step == 0 or (checks_done % step) == 0:
-                print(f"{checks_done} / {args.runs} done. {FAILURE} failures, {TIMEOUTS} timeouts, {OPTION_ERRORS} ignored.")
+                print(f"{checks_done}{total} done. {FAILURE} failures, {TIMEOUTS} timeouts, {OUT_OF_MEMORY} out of memory, {SLOW} slow, {OPTION_ERRORS} ignored.")
 
         sys.stdout.flush()
-        try:
-            # Technically not useful but this will prevent me from removing things I don't want when I inevitably mix up the args somewhere...
-            if 'apfuzz' in yamls_dir:
-                shutil.rmtree(yamls_dir)
-        except: # noqa: E722
-            pass
-    except Exception as e:
-        print("Error while handling fuzzing result:")
-        traceback.print_exception(e)
-        print("This is most likely a fuzzer bug and should be reported")
 
 
 def error(yamls_dir, apworld_name, i, args, raised):
@@ -815,11 +3304,38 @@ def error(yamls_dir, apworld_name, i, args, raised):
         msg.write("\n".join(traceback.format_exception(raised)))
 
         dump_generation_output(GenOutcome.Failure, apworld_name, i, yamls_dir, msg)
-        return gen_callback(yamls_dir, apworld_name, i, args, GenOutcome.Failure)
     except Exception as e:
         print("Error while handling fuzzing result:")
         traceback.print_exception(e)
         print("This is most likely a fuzzer bug and should be reported")
+    finally:
+        gen_callback(yamls_dir, apworld_name, i, args, GenOutcome.Failure)
+
+
+def startup_stats():
+    try:
+        rss = read_memory_status("VmRSS")
+    except OSError:
+        rss = None
+    stats = {"seconds": round(STARTUP_TIME, 3), "worlds": len(AutoWorldRegister.world_types)}
+    if rss is not None:
+        stats["rss_mib"] = round(rss / (1024 * 1024), 1)
+    return stats
+
+
+def print_startup():
+    global STARTUP_STATS
+    STARTUP_STATS = stats = startup_stats()
+    only = " (selected with -g)" if SELECTED_APWORLDS is not None else ""
+    rss = f", RSS {stats['rss_mib']:.0f} MiB" if "rss_mib" in stats else ""
+    print(f"Loaded {stats['worlds']} worlds{only} in {stats['seconds']:.2f}s{rss}")
+
+
+def generations_per_second():
+    # Runs from before a --resume didn't happen during this session
+    elapsed = time.perf_counter() - START
+    runs = SUCCESS + FAILURE + TIMEOUTS + OPTION_ERRORS + SLOW + OUT_OF_MEMORY - RESUMED_RUNS
+    return runs / elapsed if elapsed > 0 else 0
 
 
 def print_status():
@@ -828,8 +3344,45 @@ def print_status():
     print("Failures:", FAILURE)
     print("Timeouts:", TIMEOUTS)
     print("Ignored:", OPTION_ERRORS)
+    print("Slow:", SLOW)
+    print("Out of memory:", OUT_OF_MEMORY)
+    if TIMEOUT_KILLS:
+        print(f"Timeouts that needed a kill: {TIMEOUT_KILLS}")
+    if RECYCLES:
+        print("Workers recycled: {} ({})".format(
+            sum(RECYCLES.values()), ", ".join(f"{count} for {reason}" for reason, count in RECYCLES.most_common())
+        ))
+    if FIRST_RUNS:
+        print(f"First runs of a world in a worker: {FIRST_RUNS}")
+    if PHASE_TIMINGS:
+        print()
+        print("Time per phase (p50 / p95 / p99):")
+        for name in PHASES:
+            if name in PHASE_TIMINGS:
+                histogram = PHASE_TIMINGS[name]
+                print("  {:<10} {:>9.4f}s {:>9.4f}s {:>9.4f}s".format(
+                    name, histogram.percentile(50), histogram.percentile(95), histogram.percentile(99)
+                ))
+    if STAGE_TIMINGS:
+        print()
+        print(f"Time per generation stage, top {STAGES_SHOWN} by total time (p50 / p95 / p99):")
+        stages = sorted(STAGE_TIMINGS.items(), key=lambda item: -item[1].total)
+        for (game, stage), histogram in stages[:STAGES_SHOWN]:
+            print("  {:<48} {:>9.4f}s {:>9.4f}s {:>9.4f}s".format(
+                f"{game} / {stage}", histogram.percentile(50), histogram.percentile(95), histogram.percentile(99)
+            ))
+    if WORKER_PSS:
+        print()
+        print("PSS per worker: {:.0f} MiB mean, {:.0f} MiB max, over {} workers".format(
+            sum(WORKER_PSS) / len(WORKER_PSS) / (1024 * 1024), max(WORKER_PSS) / (1024 * 1024), len(WORKER_PSS)
+        ))
+    if PEAK_RSS.count:
+        print()
+        print("Peak RSS per generation: {:.0f} MiB p50, {:.0f} MiB p95, {:.0f} MiB p99".format(
+            PEAK_RSS.percentile(50), PEAK_RSS.percentile(95), PEAK_RSS.percentile(99)
+        ))
     print()
-    print("Time taken: {:.2f}s".format(time.perf_counter() - START))
+    print("Time taken: {:.2f}s ({:.2f} generations/s)".format(time.perf_counter() - START, generations_per_second()))
 
 
 def find_hook(hook_path):
@@ -848,6 +3401,11 @@ def find_hook(hook_path):
 
 
 class BaseHook:
+    # Set this to True if the hook needs the player files to exist on disk at
+    # `player_files_path` (for example to run a generation in another process).
+    # By default they're handed to Generate in memory.
+    needs_player_files = False
+
     def setup_main(self, args):
         """
         This function is guaranteed to only ever be called once, in the main process.
@@ -864,8 +3422,8 @@ class BaseHook:
         """
         This function is called once after a generation outcome has been decided.
         You can reclassify the outcome with this before it is returned to the main process by returning a new `GenOutcome`
-        Note that because timeouts are processed by the main process and not by the worker itself (as it is busy timing out),
-        this function can be called from both the main process and the workers.
+        Note that because timeouts that needed the worker to be killed are processed by the main process and not by the
+        worker itself (as it is busy timing out), this function can be called from both the main process and the workers.
         """
         return outcome, raised
 
@@ -879,32 +3437,54 @@ class BaseHook:
         pass
 
 
-def write_report(report):
+def write_report():
+    # The report is only a summary of the results stream
+    stats, report, timings, stages, memory, recycles = fold_results(os.path.join(OUT_DIR, RESULTS_FILE))
     errors = {}
 
     for game_name, game_report in report.items():
         errors[game_name] = defaultdict(lambda: [])
 
-        for exc_type, exc_report in game_report.items():
-            for exc_str, yamls in exc_report.items():
-                if exc_type == FillError:
-                    errors[game_name]["FillError"].extend(yamls)
-                else:
-                    if exc_str:
-                        errors[game_name][exc_str].extend(yamls)
-                    else:
-                        errors[game_name][str(exc_type)].extend(yamls)
-
-    stats = {
-        "total": SUCCESS + FAILURE + TIMEOUTS + OPTION_ERRORS,
-        "success": SUCCESS,
-        "failure": FAILURE,
-        "timeout": TIMEOUTS,
-        "ignored": OPTION_ERRORS,
+        for record in game_report.values():
+            if record["outcome"] == "slow":
+                continue
+            if record["outcome"] == "timeout":
+                errors[game_name][str(TimeoutError)].extend(record["reproducers"])
+            elif record["type"] == "FillError":
+                errors[game_name]["FillError"].extend(record["reproducers"])
+            else:
+                errors[game_name][record["message"] or record["type"]].extend(record["reproducers"])
+
+    stats["duration"] = round(time.perf_counter() - START, 3)
+    stats["generations_per_second"] = round(generations_per_second(), 3)
+    stats["startup"] = STARTUP_STATS
+    if WORKER_PSS:
+        stats["worker_pss_mib"] = {
+            "mean": round(sum(WORKER_PSS) / len(WORKER_PSS) / (1024 * 1024), 1),
+            "max": round(max(WORKER_PSS) / (1024 * 1024), 1),
+        }
+    computed_report = {
+        "stats": stats,
+        "errors": errors,
+        "signatures": report,
+        "timings": {
+            world: {name: histogram.summary() for name, histogram in world_timings.items()}
+            for world, world_timings in timings.items()
+        },
+        "stages": {
+            world: {
+                game: {stage: histogram.summary() for stage, histogram in game_stages.items()}
+                for game, game_stages in world_stages.items()
+            }
+            for world, world_stages in stages.items()
+        },
+        "memory": {
+            world: {field: histogram.summary() for field, histogram in world_memory.items()}
+            for world, world_memory in memory.items()
+        },
+        "recycles": recycles,
     }
 
-    computed_report = {"stats": stats, "errors": errors}
-
     with open(os.path.join(OUT_DIR, "report.json"), "w", encoding='utf-8') as fd:
         fd.write(json.dumps(computed_report))
 
@@ -912,9 +3492,7 @@ def write_report(report):
 if __name__ == "__main__":
     MAIN_HOOKS = []
 
-    def main(p, args, tmp):
-        global SUBMITTED
-
+    def main(args, tmp):
         if args.sample_from:
             if args.game:
                 raise Exception(
@@ -925,11 +3503,9 @@ if __name__ == "__main__":
                     "--sample-from is incompatible with -m/--meta"
                 )
 
-        if args.meta:
-            with open(args.meta, "r", encoding='utf-8-sig') as fd:
-                meta = yaml.safe_load(fd.read())
-        else:
-            meta = {}
+        # Only loaded here to fail early on an invalid meta file, the workers
+        # load it themselves when rolling YAMLs
+        load_meta(args.meta)
 
         apworld_names = list(dict.fromkeys(args.game))
         for apworld in apworld_names:
@@ -938,9 +3514,10 @@ if __name__ == "__main__":
                     f"Failed to resolve apworld from apworld name: {apworld}"
                 )
 
-        if os.path.exists(OUT_DIR):
-            shutil.rmtree(OUT_DIR)
-        os.makedirs(OUT_DIR)
+        if not args.resume:
+            if os.path.exists(OUT_DIR):
+                shutil.rmtree(OUT_DIR)
+            os.makedirs(OUT_DIR)
 
         for hook_class_path in args.hook:
             hook = find_hook(hook_class_path)
@@ -950,8 +3527,8 @@ if __name__ == "__main__":
 
         sys.stdout.write("\x1b[2J\x1b[H")
         sys.stdout.flush()
+        print_startup()
 
-        i = 0
         valid_worlds = [
             world.__module__.split(".")[1]
             for world in AutoWorldRegister.world_types.values()
@@ -970,31 +3547,19 @@ if __name__ == "__main__":
             if yamls_per_run_bounds[0] >= yamls_per_run_bounds[1]:
                 raise Exception("Invalid range value passed for `yamls_per_run`.")
 
-        static_yamls = []
-        if args.with_static_worlds:
-            for yaml_file in os.listdir(args.with_static_worlds):
-                path = os.path.join(args.with_static_worlds, yaml_file)
-                if not os.path.isfile(path):
-                    continue
-                with open(path, "r", encoding='utf-8-sig') as fd:
-                    static_yamls.append(fd.read())
-
         sample_yamls = []
         if args.sample_from:
-            for yaml_file in os.listdir(args.sample_from):
-                path = os.path.join(args.sample_from, yaml_file)
-                if not os.path.isfile(path):
-                    continue
-                with open(path, "r", encoding='utf-8-sig') as fd:
-                    raw = fd.read()
-                try:
-                    docs = list(yaml.safe_load_all(raw))
-                except yaml.YAMLError as e:
-                    raise Exception(f"Failed to parse {path}: {e}") from e
-                for doc in docs:
-                    if isinstance(doc, dict) and 'name' in doc:
-                        doc['name'] = 'Player{number}'
-                sample_yamls.append((yaml_file, yaml.safe_dump_all(docs, sort_keys=False)))
+            sample_index = load_sample_index(args.sample_from)
+            # Only the file names are kept in memory, workers load the files themselves
+            sample_yamls = sorted(name for name, entry in sample_index.items() if entry["error"] is None)
+            invalid = sorted(name for name, entry in sample_index.items() if entry["error"] is not None)
+            if invalid:
+                print(f"Skipping {len(invalid)} YAML(s) from --sample-from that failed to parse:")
+                for name in invalid[:10]:
+                    print(f"  {name}: {sample_index[name]['error'].splitlines()[0]}")
+                if len(invalid) > 10:
+                    print(f"  ... see {os.path.join(args.sample_from, SAMPLE_INDEX_FILE)} for the full list")
+            del sample_index
             if not sample_yamls:
                 raise Exception(
                     f"--sample-from directory {args.sample_from!r} contains no YAML files"
@@ -1004,36 +3569,41 @@ if __name__ == "__main__":
                     f"--sample-from has {len(sample_yamls)} YAML(s) but -n requests up to {yamls_per_run_bounds[-1]}"
                 )
 
-        global MANAGER
-        MANAGER = multiprocessing.Manager()
-        queue = MANAGER.Queue(1000)
-        def handle_timeouts():
-            while True:
+        # Compile the samplers before forking so that every worker inherits them
+        if not args.coordinator:
+            for apworld in apworld_names or valid_worlds:
                 try:
-                    pid, apworld_name, i, yamls_dir, out_buf = queue.get()
-                    os.kill(pid, signal.SIGTERM)
-
-                    extra = f"[...] Generation killed here after {args.timeout}s"
-                    outcome = GenOutcome.Timeout
-                    for hook in MAIN_HOOKS:
-                        outcome, _ = hook.reclassify_outcome(outcome, TimeoutError())
-                    dump_generation_output(outcome, apworld_name, i, yamls_dir, out_buf, extra)
-                    gen_callback(yamls_dir, apworld_name, i, args, outcome)
-                except KeyboardInterrupt:
-                    break
-                except EOFError:
-                    break
-                except Exception as exc:
-                    extra = "[...] Exception while timing out:\n {}".format("\n".join(traceback.format_exception(exc)))
-                    dump_generation_output(GenOutcome.Timeout, apworld_name, i, yamls_dir, out_buf, extra)
-                    gen_callback(yamls_dir, apworld_name, i, args, outcome)
-                    continue
+                    get_world_sampler(apworld, load_meta(args.meta))
+                except Exception:
+                    # The workers will try again and report it for the runs using that world
+                    pass
+
+        start, pending = 0, []
+        checkpoint = Checkpoint(os.path.join(OUT_DIR, CHECKPOINT_FILE), args.checkpoint_interval, {
+            key: getattr(args, key) for key in CAMPAIGN_SETTINGS
+        })
+        if args.resume:
+            start, pending = checkpoint.restore(args.resume_state)
+            print(f"Resuming from run {start}, running {len(pending)} unfinished run(s) again")
+        set_checkpoint(checkpoint)
+        set_results_log(ResultsLog(os.path.join(OUT_DIR, RESULTS_FILE)))
+
+        jobs = plan_runs(args, apworld_names, valid_worlds, yamls_per_run_bounds, sample_yamls, start, pending)
+        if args.coordinator:
+            serve_agents(args, jobs)
+        else:
+            run_jobs(args, tmp, jobs)
+
+    def plan_runs(args, apworld_names, valid_worlds, yamls_per_run_bounds, sample_yamls, start, pending):
+        yield from pending
 
-        timeout_handler = threading.Thread(target=handle_timeouts)
-        timeout_handler.daemon = True
-        timeout_handler.start()
+        # Past the deadline, runs that were already planned still finish
+        deadline = time.monotonic() + args.duration if args.duration is not None else None
+        i = start
+        while args.runs is None or i < args.runs:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
 
-        while i < args.runs:
             if len(yamls_per_run_bounds) == 1:
                 yamls_this_run = yamls_per_run_bounds[0]
             else:
@@ -1042,14 +3612,15 @@ if __name__ == "__main__":
                     yamls_per_run_bounds[0], yamls_per_run_bounds[1] + 1
                 )
 
+            seed = random.getrandbits(64)
             if args.sample_from:
                 actual_apworld = "sample"
-                yamls_to_write = [
-                    (f"sample-{i}-{nb}-{orig_name}", content)
-                    for nb, (orig_name, content) in enumerate(
+                job = RunDescriptor(i, [], yamls_this_run, seed, samples=[
+                    (f"sample-{i}-{nb}-{orig_name}", orig_name)
+                    for nb, orig_name in enumerate(
                         random.sample(sample_yamls, yamls_this_run)
                     )
-                ]
+                ])
             else:
                 if not apworld_names:
                     games_this_run = [random.choice(valid_worlds)]
@@ -1061,52 +3632,210 @@ if __name__ == "__main__":
                 else:
                     actual_apworld = "multi"
 
-                yamls_to_write = [
-                    (f"{i}-{nb}.yaml", generate_random_yaml(game, meta))
-                    for nb, game in enumerate(
-                        g for g in games_this_run for _ in range(yamls_this_run)
-                    )
-                ]
+                job = RunDescriptor(i, games_this_run, yamls_this_run, seed)
 
-            if i % 100 == 0:
-                clear_abc_caches()
+            yield job, actual_apworld
+            i += 1
 
-            SUBMITTED += 1
+    def run_jobs(args, tmp, jobs):
+        global DISPATCHER
+
+        timeout_queue = multiprocessing.SimpleQueue()
+        initargs = (timeout_queue, OUT_DIR, args.recycle_rss, args.recycle_after, (args, tmp) if args.warm_up else None)
+        if args.gc_freeze:
+            freeze_before_fork()
+        # Only runs of a single random world have one to be routed by
+        if args.affinity and not args.game and not args.sample_from:
+            pool = AffinityPool(args.jobs, initializer=init_worker, initargs=initargs)
+        elif args.recycle_rss or args.recycle_after:
+            pool = RecyclingPool(args.jobs, initializer=init_worker, initargs=initargs)
+        else:
+            pool = WatchedPool(args.jobs, initializer=init_worker, initargs=initargs)
+        with pool as p:
+            def handle_timeouts():
+                while True:
+                    try:
+                        msg = timeout_queue.get()
+                        if msg is None:
+                            break
+                        apworld_name, i, yamls_dir, out_buf, signature = msg
+
+                        if CAN_INTERRUPT:
+                            extra = f"[...] Generation killed here after {args.timeout + args.timeout_grace}s, it didn't stop when interrupted after {args.timeout}s"
+                        else:
+                            extra = f"[...] Generation killed here after {args.timeout}s"
+                        outcome = GenOutcome.Timeout
+                        for hook in MAIN_HOOKS:
+                            outcome, _ = hook.reclassify_outcome(outcome, TimeoutError())
+                        # The worker already skipped writing stacks if the signature has all its reproducers
+                        if signature is None or signature.reproducer:
+                            dump_generation_output(outcome, apworld_name, i, yamls_dir, out_buf, extra)
+                        gen_callback(yamls_dir, apworld_name, i, args, RunResult(outcome, signature, killed=True))
+                    except KeyboardInterrupt:
+                        break
+                    except EOFError:
+                        break
+                    except Exception as exc:
+                        extra = "[...] Exception while timing out:\n {}".format("\n".join(traceback.format_exception(exc)))
+                        dump_generation_output(GenOutcome.Timeout, apworld_name, i, yamls_dir, out_buf, extra)
+                        gen_callback(yamls_dir, apworld_name, i, args, outcome)
+                        continue
+
+            timeout_handler = threading.Thread(target=handle_timeouts)
+            timeout_handler.daemon = True
+            timeout_handler.start()
+
+            # With a deadline, runs queued in the pool would all still run
+            # after it, so keep the queue short
+            DISPATCHER = Dispatcher(args.max_in_flight or args.jobs * (2 if args.duration is not None else 10))
+
+            for job, actual_apworld in jobs:
+                # The worker creates and fills this directory itself
+                yamls_dir = os.path.join(tmp, f"apfuzz-yamls-{job.i}")
+
+                # The coordinator already decided for runs it handed out
+                if job.slow_after is None:
+                    job.slow_after = slow_threshold(actual_apworld, args)
+                # Before submitting, a fast run could otherwise finish before it's recorded as started
+                if CHECKPOINT is not None:
+                    CHECKPOINT.started(job, actual_apworld)
+                DISPATCHER.submit(
+                    p,
+                    gen_wrapper,
+                    args=(yamls_dir, job, actual_apworld, args, tmp),
+                    callback=functools.partial(gen_callback, yamls_dir, actual_apworld, job.i, args),
+                    error_callback=functools.partial(error, yamls_dir, actual_apworld, job.i, args),
+                    affinity=actual_apworld if isinstance(p, AffinityPool) else None,
+                    job=job,
+                )
+                if CHECKPOINT is not None:
+                    CHECKPOINT.maybe_save()
+
+            DISPATCHER.wait_idle()
+            timeout_queue.put(None)
+            for worker in multiprocessing.active_children():
+                pss = read_pss(worker.pid)
+                if pss is not None:
+                    WORKER_PSS.append(pss)
+
+    def serve_agents(args, jobs):
+        coordinator = Coordinator(args, jobs)
+        handlers = []
+        with socket.create_server(parse_address(args.coordinator)) as server:
+            print(f"Waiting for agents on {args.coordinator}")
+            server.settimeout(1)
+            while not coordinator.finished():
+                CHECKPOINT.maybe_save()
+                try:
+                    sock, address = server.accept()
+                except socket.timeout:
+                    continue
+                sock.setblocking(True)
+                print(f"Agent connected from {address[0]}:{address[1]}")
+                handler = threading.Thread(target=coordinator.handle_agent, args=(sock,), daemon=True)
+                handler.start()
+                handlers.append(handler)
+
+        # Give the agents a chance to hear that the campaign is over
+        for handler in handlers:
+            handler.join(5)
+
+    def agent(args, tmp):
+        global OUT_DIR, RESULT_SINK
+
+        sock = socket.create_connection(parse_address(args.agent))
+        connection = AgentConnection(sock)
+        connection.send({"type": "hello", "host": platform.node(), "jobs": args.jobs})
+        config = connection.recv()
+        if config is None:
+            raise Exception(f"The coordinator at {args.agent} closed the connection")
+        for key, value in config["settings"].items():
+            setattr(args, key, value)
+
+        # Dumps only live here until they're sent to the coordinator
+        OUT_DIR = os.path.join(tmp, "fuzz_output")
+        os.makedirs(OUT_DIR)
 
-            yamls_dir = tempfile.mkdtemp(prefix="apfuzz", dir=tmp)
-            for name, yaml_content in yamls_to_write:
-                yaml_path = os.path.join(yamls_dir, name)
-                open(yaml_path, "wb").write(yaml_content.encode("utf-8"))
+        for hook_class_path in args.hook:
+            hook = find_hook(hook_class_path)
+            hook.setup_main(args)
 
-            for nb, yaml_content in enumerate(static_yamls):
-                yaml_path = os.path.join(yamls_dir, f"static-{i}-{nb}.yaml")
-                open(yaml_path, "wb").write(yaml_content.encode("utf-8"))
+            MAIN_HOOKS.append(hook)
 
-            last_job = p.apply_async(
-                gen_wrapper,
-                args=(yamls_dir, actual_apworld, i, args, queue, tmp),
-                callback=functools.partial(gen_callback, yamls_dir, actual_apworld, i, args),
-                error_callback=functools.partial(error, yamls_dir, actual_apworld, i, args),
-            )
+        RESULT_SINK = connection.send_result
+        run_jobs(args, tmp, connection.jobs(args.jobs * 2))
+        connection.send({"type": "bye"})
+        sock.close()
 
-            while SUBMITTED >= args.jobs * 10:
-                # Poll the last job to keep the queue running
-                last_job.ready()
-                time.sleep(0.001)
+    def minimize(args, tmp):
+        failure_dir = args.minimize
+        player_files, gen_seed = load_failure_dir(failure_dir)
+        if not player_files:
+            raise Exception(f"No player files found in {failure_dir!r}")
+        if gen_seed is None:
+            gen_seed = random.randint(0, 1000000000)
+            print(f"No seed recorded in {failure_dir!r}, using {gen_seed}")
 
-            i += 1
+        for hook_class_path in args.hook:
+            hook = find_hook(hook_class_path)
+            hook.setup_main(args)
+
+            MAIN_HOOKS.append(hook)
 
-        while SUBMITTED > 0:
-            last_job.ready()
-            time.sleep(0.05)
+        timeout_queue = multiprocessing.SimpleQueue()
+        with Pool(processes=args.jobs, maxtasksperchild=None, initializer=init_worker, initargs=(timeout_queue, OUT_DIR)) as p:
+            minimizer = Minimizer(p, args, tmp, player_files, gen_seed, None)
+
+            def handle_timeouts():
+                while True:
+                    msg = timeout_queue.get()
+                    if msg is None:
+                        break
+                    _, i, yamls_dir, _, _ = msg
+                    shutil.rmtree(yamls_dir, ignore_errors=True)
+                    minimizer.timed_out(i)
+
+            timeout_handler = threading.Thread(target=handle_timeouts)
+            timeout_handler.daemon = True
+            timeout_handler.start()
+
+            result = minimizer.run([player_files])[0]
+            outcome, signature = result.outcome, result.signature
+            if outcome == GenOutcome.Success:
+                raise Exception(f"The failure in {failure_dir!r} doesn't reproduce")
+            if args.signature is not None and (signature is None or signature.digest != args.signature):
+                found = signature.digest if signature is not None else "none"
+                raise Exception(f"The failure in {failure_dir!r} reproduces with signature {found}, not {args.signature}")
+            minimizer.target = (outcome, signature.digest if signature is not None else None)
+            print(f"Reproduced the failure, signature {minimizer.target[1]}")
+
+            minimizer.minimize_players()
+            print(f"Kept {len(minimizer.player_files)} out of {len(player_files)} player(s)")
+            options, kept = minimizer.minimize_options()
+            print(f"Kept {kept} out of {options} option(s)")
+
+            timeout_queue.put(None)
+
+        minimized_dir = os.path.join(failure_dir, "minimized")
+        shutil.rmtree(minimized_dir, ignore_errors=True)
+        write_player_files(minimized_dir, [PlayerFile(name, docs) for name, docs in minimizer.player_files])
+        write_generation_seed(minimized_dir, gen_seed)
+        print(f"Ran {minimizer.generations} generations, minimized YAMLs written to {minimized_dir}")
+        print("Time taken: {:.2f}s".format(time.perf_counter() - START))
 
     parser = ArgumentParser(prog="apfuzz")
     parser.add_argument("-g", "--game", default=[], action="append",
                         help="Restrict to a given apworld. Can be passed multiple times to fuzz several games together; each generation will include N (see -n) YAMLs for each listed game.")
     parser.add_argument("-j", "--jobs", default=10, type=int)
-    parser.add_argument("-r", "--runs", type=int, required=True)
+    parser.add_argument("-r", "--runs", type=int)
+    parser.add_argument("--duration", default=None, type=parse_duration,
+                        help="Stop starting new runs after this long, e.g. 3600, 90m or 8h. Runs already started still finish")
     parser.add_argument("-n", "--yamls_per_run", default="1", type=str)
     parser.add_argument("-t", "--timeout", default=15, type=int)
+    parser.add_argument("--timeout-grace", default=5, type=int,
+                        help="How long a generation that didn't stop when interrupted at the timeout gets before its worker is killed")
+    parser.add_argument("--max-in-flight", default=None, type=int,
+                        help="Maximum number of runs submitted to the pool at once. Defaults to 10 times the number of jobs")
     parser.add_argument("-m", "--meta", default=None, type=None)
     parser.add_argument("--dump-ignored", default=False, action="store_true")
     parser.add_argument("--with-static-worlds", default=None)
@@ -1114,9 +3843,73 @@ if __name__ == "__main__":
                         help="Directory of YAML files to sample from instead of generating random YAMLs. Each generation picks N (see -n) random files from the directory. Incompatible with -g and -m")
     parser.add_argument("--hook", action="append", default=[])
     parser.add_argument("--skip-output", default=False, action="store_true")
+    parser.add_argument("--keep-reproducers", default=5, type=int,
+                        help="How many runs to dump for every failure signature, later ones are only counted. 0 dumps all of them")
+    parser.add_argument("--minimize", default=None, metavar="FAILURE_DIR",
+                        help="Reduce the YAMLs of a failure dumped in fuzz_output to the players and options needed to reproduce it instead of fuzzing")
+    parser.add_argument("--signature", default=None,
+                        help="With --minimize, the failure signature to preserve. Defaults to the one the failure reproduces with")
+    parser.add_argument("--coordinator", default=None, metavar="HOST:PORT",
+                        help="Listen on HOST:PORT and hand out the runs of the campaign to agents instead of running them")
+    parser.add_argument("--agent", default=None, metavar="HOST:PORT",
+                        help="Run the generations handed out by the coordinator listening on HOST:PORT")
+    parser.add_argument("--resume", default=False, action="store_true",
+                        help="Continue the campaign from the checkpoint in fuzz_output. Its arguments are reused, -r can be passed to change the number of runs")
+    parser.add_argument("--checkpoint-interval", default=60, type=int,
+                        help="How often, in seconds, to save the progress of the campaign for --resume")
+    parser.add_argument("--sample-profile", default=None, type=int, metavar="HZ",
+                        help="Sample the stacks of generations HZ times per second of CPU time and write a profile per world to fuzz_output/profile")
+    parser.add_argument("--slow-factor", default=5, type=float,
+                        help="Count successful generations that take longer than this many times the median of their world as slow and dump them with a profile. Set to 0 to disable")
+    parser.add_argument("--memory-limit", default=None, type=int, metavar="MB",
+                        help="How much memory a generation can allocate, in MiB, before it's stopped as out of memory")
+    parser.add_argument("--tracemalloc", action="store_true", default=False,
+                        help="Trace Python allocations to record the peak of every generation. Slows down generations")
+    parser.add_argument("--recycle-rss", default=None, type=int, metavar="MB",
+                        help="Replace workers whose RSS is above MB MiB after a generation")
+    parser.add_argument("--recycle-after", default=None, type=int, metavar="RUNS",
+                        help="Replace workers after RUNS generations")
+    parser.add_argument("--no-gc-freeze", dest="gc_freeze", action="store_false", default=True,
+                        help="Don't freeze the main process' objects before forking the workers")
+    parser.add_argument("--no-warm-up", dest="warm_up", action="store_false", default=True,
+                        help="Don't run a throwaway generation of every -g world in each worker before fuzzing")
+    parser.add_argument("--no-affinity", dest="affinity", action="store_false", default=True,
+                        help="Don't prefer sending the runs of a world to the workers that ran it recently")
+    parser.add_argument("--roll-batch", default=1, type=int,
+                        help="How many option sets a worker rolls at once for a world. Above 1, a run's options can't be rolled again from its seed")
+    parser.add_argument("--benchmark-samplers", default=None, type=int, metavar="ROLLS",
+                        help="Roll ROLLS option sets for every selected world with and without compiled samplers, print the timings and exit")
 
     args = parser.parse_args()
 
+    if args.benchmark_samplers:
+        benchmark_samplers(list(dict.fromkeys(args.game)) or [
+            world.__module__.split(".")[1] for world in AutoWorldRegister.world_types.values()
+        ], load_meta(args.meta), args.benchmark_samplers, args.roll_batch)
+        sys.exit(0)
+
+    args.resume_state = None
+    if args.resume:
+        try:
+            args.resume_state = read_checkpoint(os.path.join(OUT_DIR, CHECKPOINT_FILE))
+        except (OSError, ValueError) as e:
+            parser.error(f"can't resume: {e}")
+        runs = args.runs
+        for key, value in args.resume_state["settings"].items():
+            setattr(args, key, value)
+        if runs is not None:
+            args.runs = runs
+
+    if args.sample_profile and not hasattr(signal, "SIGPROF"):
+        parser.error("--sample-profile isn't supported on this platform")
+    if args.recycle_after is not None and args.recycle_after < 1:
+        parser.error("--recycle-after must be at least 1")
+    if args.memory_limit and not CAN_LIMIT_MEMORY:
+        parser.error("--memory-limit isn't supported on this platform")
+
+    if args.runs is None and args.duration is None and not (args.minimize or args.agent):
+        parser.error("one of -r/--runs or --duration is required")
+
     # This is just to make sure that the host.yaml file exists by the time we fork
     # so that a first run on a new installation doesn't throw out failures until
     # the host.yaml from the first gen is written
@@ -1129,27 +3922,45 @@ if __name__ == "__main__":
         start_method = "fork" if can_fork else "spawn"
         multiprocessing.set_start_method(start_method)
         tmp = tempfile.TemporaryDirectory(prefix="apfuzz")
-        with Pool(processes=args.jobs, maxtasksperchild=None) as p:
-            START = time.perf_counter()
-            main(p, args, tmp.name)
+        START = time.perf_counter()
+        if args.minimize:
+            minimize(args, tmp.name)
+        elif args.agent:
+            agent(args, tmp.name)
+        else:
+            # The coordinator doesn't fork any worker, run_jobs enables the GC again once it froze everything
+            if args.gc_freeze and not args.coordinator:
+                gc.disable()
+            main(args, tmp.name)
     except KeyboardInterrupt:
         pass
     except Exception as e:
         crashed = True
         traceback.print_exc()
     finally:
+        # In case main stopped before getting to freeze_before_fork
+        gc.enable()
+        if CHECKPOINT is not None:
+            CHECKPOINT.save()
+        if RESULTS_LOG is not None:
+            RESULTS_LOG.close()
+
         for hook in MAIN_HOOKS:
             hook.finalize()
 
         tmp.cleanup()
 
-        if MANAGER is not None:
-            MANAGER._process.kill()
+        if not crashed and args.minimize:
+            os._exit(0)
 
         if not crashed:
             print_status()
-            write_report(REPORT)
-            os._exit((FAILURE + TIMEOUTS) != 0)
+            # Agents send their results to the coordinator which writes the report
+            if not args.agent:
+                write_report()
+                if args.sample_profile:
+                    write_profiles()
+            os._exit((FAILURE + TIMEOUTS + OUT_OF_MEMORY) != 0)
 
         os._exit(2)
 
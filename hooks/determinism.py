@@ -281,6 +281,9 @@ from fuzz import BaseHook, GenOutcome, ap_path as _AP_PATH
 
 
 class Hook(BaseHook):
+    # The subprocess runs Generate on the same player_files_path
+    needs_player_files = True
+
     def __init__(self):
         self._proc = None
         self._stdin = None
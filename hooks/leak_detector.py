@@ -0,0 +1,134 @@
+"""
+Looks for objects that worlds leak from one generation to the next, through class attributes, `lru_cache`s,
+registries on `AutoWorldRegister`...
+
+Before every generation, the hook takes a snapshot of what's alive in the worker and attributes what grew since the
+previous snapshot to the game(s) of the previous generation, whose multiworld is gone by then. The first generation of
+a game in a worker is skipped as it legitimately fills caches. Growth that shows up in at least half of the generations
+of a game is reported in `fuzz_output/leaks.json` at the end.
+
+`Hook` counts the objects tracked by the GC by type, `TracemallocHook` reports the lines that allocated the memory
+that grew instead but is a lot slower.
+"""
+
+from collections import defaultdict
+import gc
+import json
+import os
+import tracemalloc
+
+import fuzz
+from fuzz import BaseHook, OUT_DIR
+
+# How many growing types or lines are kept per game in the report
+REPORT_SIZE = 50
+
+
+class Hook(BaseHook):
+    def __init__(self):
+        self.previous = None
+        self.previous_game = None
+        # game -> key -> [count, size, generations it grew in]
+        self.growth = defaultdict(lambda: defaultdict(lambda: [0, 0, 0]))
+        # game -> generations that were diffed
+        self.generations = defaultdict(int)
+        self.seen = set()
+
+    def setup_main(self, args):
+        os.makedirs(os.path.join(OUT_DIR, "leaks"), exist_ok=True)
+
+    def snapshot(self):
+        counts = defaultdict(int)
+        for obj in gc.get_objects():
+            cls = type(obj)
+            counts[f"{cls.__module__}.{cls.__qualname__}"] += 1
+        return counts
+
+    def diff(self, before, after):
+        """Yields `(key, count, size)` for everything that grew"""
+        for key, count in after.items():
+            grown = count - before.get(key, 0)
+            if grown > 0:
+                yield key, grown, 0
+
+    def before_generate(self, args):
+        gc.collect()
+        current = self.snapshot()
+        game = self.previous_game
+        if game is not None and self.previous is not None:
+            if game in self.seen:
+                self.generations[game] += 1
+                for key, count, size in self.diff(self.previous, current):
+                    entry = self.growth[game][key]
+                    entry[0] += count
+                    entry[1] += size
+                    entry[2] += 1
+                self.save()
+            self.seen.add(game)
+        self.previous = current
+        self.previous_game = None
+
+    def after_generate(self, mw, output_path):
+        # Generations that didn't get a multiworld can't be attributed, they still reset the baseline
+        if mw is not None:
+            self.previous_game = "+".join(sorted(set(mw.game.values())))
+
+    def save(self):
+        path = os.path.join(OUT_DIR, "leaks", f"leaks_{os.getpid()}.json")
+        with open(path, "w", encoding="utf-8") as fd:
+            json.dump({"generations": self.generations, "growth": self.growth}, fd)
+
+    def finalize(self):
+        leaks_dir = os.path.join(OUT_DIR, "leaks")
+        generations = defaultdict(int)
+        growth = defaultdict(lambda: defaultdict(lambda: [0, 0, 0]))
+        for name in os.listdir(leaks_dir):
+            with open(os.path.join(leaks_dir, name), "r", encoding="utf-8") as fd:
+                worker = json.load(fd)
+            for game, count in worker["generations"].items():
+                generations[game] += count
+            for game, keys in worker["growth"].items():
+                for key, (count, size, grown) in keys.items():
+                    entry = growth[game][key]
+                    entry[0] += count
+                    entry[1] += size
+                    entry[2] += grown
+
+        report = {}
+        for game, keys in growth.items():
+            total = generations[game]
+            leaking = [
+                {
+                    "key": key,
+                    "generations_grown": grown,
+                    "count_per_generation": round(count / total, 2),
+                    "size_per_generation": round(size / total),
+                }
+                for key, (count, size, grown) in keys.items()
+                if grown * 2 >= total
+            ]
+            leaking.sort(key=lambda entry: (entry["size_per_generation"], entry["count_per_generation"]), reverse=True)
+            report[game] = {"generations": total, "growing": leaking[:REPORT_SIZE]}
+
+        with open(os.path.join(OUT_DIR, "leaks.json"), "w", encoding="utf-8") as fd:
+            json.dump(report, fd, indent=2)
+
+
+class TracemallocHook(Hook):
+    def setup_worker(self, args):
+        super().setup_worker(args)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, fuzz.__file__),
+        ])
+
+    def diff(self, before, after):
+        for stat in after.compare_to(before, "lineno"):
+            if stat.size_diff > 0:
+                frame = stat.traceback[0]
+                yield f"{frame.filename}:{frame.lineno}", max(stat.count_diff, 0), stat.size_diff